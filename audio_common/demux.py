@@ -0,0 +1,59 @@
+import wave
+import numpy as np
+
+
+
+SAMPLE_DTYPES = {1: np.uint8, 2: "<i2", 4: "<i4"}
+
+
+class ChannelDemuxer():
+    """ Writes an interleaved capture to the all-channels WAV and to one mono WAV per
+    selected channel in a single pass, viewing each buffer as a (frames, channels) array.
+
+    channel_paths maps channel index -> output path, e.g. {0: ".../air_demo.wav"}.
+    """
+    def __init__(self, all_channels_path:str, channel_paths:dict, channels:int, sampwidth:int, rate:int) -> None:
+        if sampwidth not in SAMPLE_DTYPES:
+            raise ValueError(f"Unsupported sample width: {sampwidth}")
+        for channel in channel_paths:
+            if not 0 <= channel < channels:
+                raise ValueError(f"Channel {channel} out of range for {channels} channels")
+        self.all_channels_path = all_channels_path
+        self.channel_paths = channel_paths
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.rate = rate
+        self.dtype = SAMPLE_DTYPES[sampwidth]
+        self.all_channels_file = None
+        self.channel_files = {}
+
+
+    def _open_wav(self, path:str, channels:int):
+        wav_file = wave.open(path, "wb")
+        wav_file.setnchannels(channels)             # number of channels
+        wav_file.setsampwidth(self.sampwidth)       # sample width in bytes
+        wav_file.setframerate(self.rate)
+        return wav_file
+
+
+    def open(self):
+        self.all_channels_file = self._open_wav(self.all_channels_path, self.channels)
+        self.channel_files = {channel: self._open_wav(path, 1) for channel, path in self.channel_paths.items()}
+
+
+    def write(self, data):
+        """ data: any bytes-like object holding interleaved frames (bytes, ndarray view, ...) """
+        self.all_channels_file.writeframesraw(data)
+        if not self.channel_files:
+            return
+        frames = np.frombuffer(data, dtype=self.dtype).reshape(-1, self.channels)
+        for channel, wav_file in self.channel_files.items():
+            wav_file.writeframesraw(frames[:, channel].tobytes())
+
+
+    def close(self):
+        # closing patches the WAV headers with the number of frames written
+        self.all_channels_file.close()
+        for wav_file in self.channel_files.values():
+            wav_file.close()
+        self.channel_files = {}
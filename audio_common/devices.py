@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import pyaudio
+
+
+
+PROBE_RATES = (16000, 22050, 32000, 44100, 48000, 88200, 96000)
+
+PROBE_FORMATS = {
+    "int16": pyaudio.paInt16,
+    "int24": pyaudio.paInt24,
+    "int32": pyaudio.paInt32,
+    "float32": pyaudio.paFloat32,
+}
+
+FORMAT_NAMES = {value: key for key, value in PROBE_FORMATS.items()}
+
+
+def device_key(dev_dict:dict, host_api_name:str) -> str:
+    """ stable key of a device across PortAudio sessions (indexes are not stable) """
+    return f"{dev_dict['name']}|{host_api_name}"
+
+
+class DeviceCatalog():
+    """ Initializes PortAudio once and indexes the devices by name and host API.
+
+    Supported rates, channel counts and sample formats of every device are probed once
+    and cached as a JSON profile; the profile is reused as long as the hardware
+    fingerprint (names, host APIs and channel counts of all devices) does not change.
+    Streams of the whole app should be opened on catalog.pa.
+    """
+    _shared = None
+
+    @classmethod
+    def shared(cls, profile_path:str) -> "DeviceCatalog":
+        """ process wide catalog, PortAudio is initialized on first use only """
+        if cls._shared is None:
+            cls._shared = cls(profile_path)
+        return cls._shared
+
+
+    def __init__(self, profile_path:str) -> None:
+        self.profile_path = profile_path
+        self.pa = pyaudio.PyAudio()
+        self.refresh()
+
+
+    def refresh(self, reinitialize=False, force_probe=False):
+        """ rebuilds the index. PortAudio only sees hot-plugged hardware after reinitialize=True,
+        which invalidates any stream opened on the previous catalog.pa """
+        if reinitialize:
+            self.pa.terminate()
+            self.pa = pyaudio.PyAudio()
+
+        host_apis = [self.pa.get_host_api_info_by_index(i)["name"] for i in range(self.pa.get_host_api_count())]
+        self.devices = []
+        self.by_name = {}
+        self.by_host_api = {}
+        for idx in range(self.pa.get_device_count()):
+            dev_dict = self.pa.get_device_info_by_index(idx)
+            dev_dict["hostApiName"] = host_apis[dev_dict["hostApi"]]
+            self.devices.append(dev_dict)
+            self.by_name.setdefault(dev_dict["name"], []).append(dev_dict)
+            self.by_host_api.setdefault(dev_dict["hostApiName"], []).append(dev_dict)
+
+        self.fingerprint = self._fingerprint()
+        profile = None if force_probe else self._load_profile()
+        if profile is not None and profile["fingerprint"] == self.fingerprint:
+            self.capabilities = profile["devices"]
+        else:
+            self.capabilities = {device_key(dev_dict, dev_dict["hostApiName"]): self._probe(dev_dict)
+                                 for dev_dict in self.devices}
+            self._save_profile()
+
+
+    def _fingerprint(self) -> str:
+        summary = [(d["name"], d["hostApiName"], d["maxInputChannels"], d["maxOutputChannels"], d["defaultSampleRate"])
+                   for d in self.devices]
+        return hashlib.sha1(json.dumps(summary).encode("utf-8")).hexdigest()
+
+
+    def _load_profile(self):
+        if not os.path.isfile(self.profile_path):
+            return None
+        try:
+            with open(self.profile_path, "r", encoding="utf-8") as in_file:
+                return json.load(in_file)
+        except (ValueError, OSError):
+            return None
+
+
+    def _save_profile(self):
+        os.makedirs(os.path.dirname(self.profile_path) or ".", exist_ok=True)
+        tmp_path = self.profile_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as out_file:
+            json.dump({"fingerprint": self.fingerprint, "devices": self.capabilities}, out_file, indent=2)
+        os.replace(tmp_path, self.profile_path)
+
+
+    def _is_supported(self, dev_dict:dict, is_input:bool, rate:int, channels:int, fmt:int) -> bool:
+        kwargs = {"input_device": dev_dict["index"], "input_channels": channels, "input_format": fmt} if is_input \
+            else {"output_device": dev_dict["index"], "output_channels": channels, "output_format": fmt}
+        try:
+            return self.pa.is_format_supported(rate=rate, **kwargs)
+        except ValueError:
+            return False
+
+
+    def _probe(self, dev_dict:dict) -> dict:
+        """ rates/formats are probed in stereo (or mono), channel counts at the default rate in int16 """
+        capabilities = {}
+        for direction, max_channels in (("input", dev_dict["maxInputChannels"]), ("output", dev_dict["maxOutputChannels"])):
+            if max_channels == 0:
+                continue
+            is_input = direction == "input"
+            probe_channels = min(2, max_channels)
+            default_rate = int(dev_dict["defaultSampleRate"])
+            formats = {}
+            for name, fmt in PROBE_FORMATS.items():
+                rates = [rate for rate in PROBE_RATES if self._is_supported(dev_dict, is_input, rate, probe_channels, fmt)]
+                if rates:
+                    formats[name] = rates
+            channels = [ch for ch in range(1, max_channels + 1)
+                        if self._is_supported(dev_dict, is_input, default_rate, ch, pyaudio.paInt16)]
+            capabilities[direction] = {"formats": formats, "channels": channels}
+        return capabilities
+
+
+    def find(self, name:str, host_api=None):
+        """ returns the device info dict, or None if no device has this name (on this host API) """
+        for dev_dict in self.by_name.get(name, []):
+            if host_api is None or dev_dict["hostApiName"] == host_api:
+                print("Found: ", dev_dict)
+                return dev_dict
+        return None
+
+
+    def get_capabilities(self, dev_dict:dict) -> dict:
+        return self.capabilities.get(device_key(dev_dict, dev_dict["hostApiName"]), {})
+
+
+    def supports(self, dev_dict:dict, rate:int, channels:int, fmt=pyaudio.paInt16, is_input=True) -> bool:
+        """ cached equivalent of pa.is_format_supported """
+        if rate not in PROBE_RATES:
+            return self._is_supported(dev_dict, is_input, rate, channels, fmt)
+        capabilities = self.get_capabilities(dev_dict).get("input" if is_input else "output")
+        if capabilities is None:
+            return False
+        rates = capabilities["formats"].get(FORMAT_NAMES.get(fmt), [])
+        return rate in rates and channels in capabilities["channels"]
+
+
+    def print_all_devices(self):
+        for dev_dict in self.devices:
+            for key, value in dev_dict.items():
+                print(key, value)
+            print("capabilities", self.get_capabilities(dev_dict))
+
+
+    def terminate(self):
+        self.pa.terminate()
+        if DeviceCatalog._shared is self:
+            DeviceCatalog._shared = None
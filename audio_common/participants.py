@@ -0,0 +1,85 @@
+import csv
+import os
+import sqlite3
+
+
+
+class ParticipantRegistry():
+    """ Participant table shared by every recording station, backed by SQLite.
+
+    register() allocates the next participant id and stores the row in a single
+    write transaction, so concurrent processes never get the same id. The legacy
+    participants.csv is imported on first use and kept in sync by appending one line
+    per registration (under the same lock), so nothing needs to load the whole table.
+    """
+    def __init__(self, db_path:str, csv_path:str, fields:list) -> None:
+        self.db_path = db_path
+        self.csv_path = csv_path
+        self.fields = list(fields)
+        self.connection = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        columns = ", ".join(f'"{field}" TEXT' for field in self.fields)
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS participants (participant_id INTEGER PRIMARY KEY, {columns})")
+        self._import_csv()
+
+
+    def _import_csv(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            is_empty = self.connection.execute("SELECT COUNT(*) FROM participants").fetchone()[0] == 0
+            if is_empty and os.path.isfile(self.csv_path):
+                with open(self.csv_path, "r", newline="", encoding="utf-8") as in_file:
+                    rows = [[int(float(row["participant_id"]))] + [row.get(field) or None for field in self.fields]
+                            for row in csv.DictReader(in_file)]
+                self.connection.executemany(self._insert_sql(), rows)
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+
+    def _insert_sql(self) -> str:
+        columns = ", ".join(f'"{field}"' for field in self.fields)
+        placeholders = ", ".join("?" for _ in range(len(self.fields) + 1))
+        return f"INSERT INTO participants (participant_id, {columns}) VALUES ({placeholders})"
+
+
+    def register(self, info:dict) -> int:
+        """ stores a new participant and returns its id """
+        values = [None if info.get(field) is None else str(info.get(field)) for field in self.fields]
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            participant_id = self.connection.execute(
+                "SELECT COALESCE(MAX(participant_id) + 1, 0) FROM participants").fetchone()[0]
+            self.connection.execute(self._insert_sql(), [participant_id] + values)
+            self._append_csv([participant_id] + values)
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return participant_id
+
+
+    def _append_csv(self, row:list):
+        write_header = not os.path.isfile(self.csv_path) or os.path.getsize(self.csv_path) == 0
+        with open(self.csv_path, "a", newline="", encoding="utf-8") as out_file:
+            writer = csv.writer(out_file)
+            if write_header:
+                writer.writerow(["participant_id"] + self.fields)
+            writer.writerow(["" if value is None else value for value in row])
+
+
+    def export_csv(self, csv_path=None):
+        """ rewrites the whole csv from the database """
+        csv_path = csv_path if csv_path is not None else self.csv_path
+        rows = self.connection.execute("SELECT * FROM participants ORDER BY participant_id").fetchall()
+        tmp_path = csv_path + ".tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(["participant_id"] + self.fields)
+            for row in rows:
+                writer.writerow(["" if value is None else value for value in row])
+        os.replace(tmp_path, csv_path)
+
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,108 @@
+import numpy as np
+
+
+
+class CaptureRing():
+    """ Preallocated single-producer/single-consumer ring of interleaved audio frames.
+
+    The producer (a PortAudio callback) copies each buffer into the NumPy backing store
+    through a memoryview, so nothing is allocated per callback. The consumer (a writer
+    thread or a level meter) reads zero-copy views and releases them with advance().
+    No lock is taken: the producer only moves frames_written and the consumer only moves
+    frames_read, each publishing its counter after the copy is done. When the consumer
+    lags behind, the incoming buffer is dropped and counted in overrun_frames rather
+    than overwriting unread data.
+    """
+    def __init__(self, capacity_frames:int, channels:int, dtype="<i2") -> None:
+        self.capacity = capacity_frames
+        self.channels = channels
+        self.buffer = np.zeros((capacity_frames, channels), dtype=dtype)
+        self.frame_size = self.buffer.itemsize * channels
+        self._bytes = memoryview(self.buffer).cast("B")
+        self._capacity_bytes = capacity_frames * self.frame_size
+
+        self.frames_written = 0   # only updated by the producer
+        self.frames_read = 0      # only updated by the consumer
+        self.overrun_frames = 0
+        self.overrun_buffers = 0
+
+
+    def reset(self):
+        """ not thread safe, call it while no stream is feeding the ring """
+        self.frames_written = 0
+        self.frames_read = 0
+        self.overrun_frames = 0
+        self.overrun_buffers = 0
+
+
+    def available(self) -> int:
+        """ number of frames written but not yet consumed """
+        return self.frames_written - self.frames_read
+
+
+    # ---- producer side ----
+
+    def write(self, in_data) -> bool:
+        """ copies a PortAudio buffer (bytes-like) into the ring, returns False if it was dropped """
+        if not isinstance(in_data, bytes):
+            in_data = memoryview(in_data).cast("B")
+        nbytes = len(in_data)
+        frames = nbytes // self.frame_size
+        if frames > self.capacity - (self.frames_written - self.frames_read):
+            self.overrun_frames += frames
+            self.overrun_buffers += 1
+            return False
+
+        start = (self.frames_written % self.capacity) * self.frame_size
+        if start + nbytes <= self._capacity_bytes:
+            self._bytes[start:start + nbytes] = in_data
+        else:
+            src = memoryview(in_data)
+            first = self._capacity_bytes - start
+            self._bytes[start:] = src[:first]
+            self._bytes[:nbytes - first] = src[first:]
+        self.frames_written += frames
+        return True
+
+
+    # ---- consumer side ----
+
+    def views(self, max_frames=None) -> list:
+        """ zero-copy (frames, channels) views over the unread data, at most two because of the wrap.
+        The views stay valid until advance() is called. """
+        count = self.available()
+        if max_frames is not None:
+            count = min(count, max_frames)
+        if count == 0:
+            return []
+        start = self.frames_read % self.capacity
+        first = min(count, self.capacity - start)
+        views = [self.buffer[start:start + first]]
+        if first < count:
+            views.append(self.buffer[:count - first])
+        return views
+
+
+    def advance(self, frames:int):
+        """ releases frames returned by views() back to the producer """
+        if frames > self.available():
+            raise ValueError(f"Cannot release {frames} frames, only {self.available()} available")
+        self.frames_read += frames
+
+
+    def read(self, max_frames=None) -> np.ndarray:
+        """ copies out and consumes the unread data """
+        views = self.views(max_frames)
+        if not views:
+            return self.buffer[:0].copy()
+        out = np.concatenate(views, axis=0)
+        self.advance(len(out))
+        return out
+
+
+    def latest(self, frames:int) -> np.ndarray:
+        """ copy of the most recently written frames, without consuming them (e.g. for level meters) """
+        end = self.frames_written
+        frames = min(frames, end, self.capacity)
+        idx = np.arange(end - frames, end) % self.capacity
+        return self.buffer[idx]
@@ -0,0 +1,75 @@
+import threading
+from audio_common.demux import ChannelDemuxer, SAMPLE_DTYPES
+from audio_common.ring_buffer import CaptureRing
+
+
+
+class StreamingWavWriter():
+    """ Drains captured PortAudio buffers into an open WAV file on a background thread.
+
+    The capture callback only copies the buffer into a preallocated CaptureRing with
+    write(); when the ring is full the buffer is dropped and counted instead of blocking
+    the real-time thread, so memory stays flat whatever the length of the take.
+    Channels listed in channel_paths are demuxed to their own mono files on the fly.
+    """
+    def __init__(self, output_path:str, channels:int, sampwidth:int, rate:int,
+                 channel_paths=None, capacity_frames=2**18, poll_interval=0.01) -> None:
+        self.output_path = output_path
+        self.channel_paths = channel_paths if channel_paths is not None else {}
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.rate = rate
+        self.poll_interval = poll_interval
+        self.ring = CaptureRing(capacity_frames, channels, dtype=SAMPLE_DTYPES[sampwidth])
+
+        self.written_frames = 0
+        self.max_backlog_frames = 0
+        self.demuxer = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+
+    def start(self):
+        self.demuxer = ChannelDemuxer(self.output_path, self.channel_paths, channels=self.channels,
+                                      sampwidth=self.sampwidth, rate=self.rate)
+        self.demuxer.open()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+
+    def write(self, data:bytes):
+        """ called from the capture callback, never blocks """
+        self.ring.write(data)
+
+
+    def _drain(self) -> int:
+        backlog = self.ring.available()
+        if backlog > self.max_backlog_frames:
+            self.max_backlog_frames = backlog
+        drained = 0
+        for view in self.ring.views():
+            self.demuxer.write(view)
+            drained += len(view)
+        self.ring.advance(drained)
+        self.written_frames += drained
+        return drained
+
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            if self._drain() == 0:
+                self.stop_event.wait(self.poll_interval)
+        self._drain()
+
+
+    def close(self):
+        """ flushes the (bounded) backlog and finalizes the WAV headers """
+        self.stop_event.set()
+        self.thread.join()
+        self.demuxer.close()
+
+
+    def stats(self) -> dict:
+        return {"written_frames": self.written_frames, "dropped_buffers": self.ring.overrun_buffers,
+                "dropped_frames": self.ring.overrun_frames, "max_backlog_frames": self.max_backlog_frames}
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# devices, participants, capture and WAV writing are shared with the other app and xpGUI,
+# in the audio_common package at the root of the repository
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
@@ -0,0 +1,124 @@
+import threading
+from audio_common.demux import ChannelDemuxer, SAMPLE_DTYPES
+from audio_common.ring_buffer import CaptureRing
+
+
+
+class Segment():
+    """ A [start_frame, end_frame) cut of the session capture written to its own set of files. """
+    def __init__(self, start_frame:int, demuxer:ChannelDemuxer) -> None:
+        self.start_frame = start_frame
+        self.end_frame = None
+        self.demuxer = demuxer
+        self.written_frames = 0
+        self.done = threading.Event()
+
+
+    def wait(self, timeout=None) -> bool:
+        """ blocks until every frame of the segment is on disk and its files are closed """
+        return self.done.wait(timeout)
+
+
+
+class SegmentedCapture():
+    """ Capture that stays open for a whole session and is cut into per-track files.
+
+    The input callback copies every buffer into a CaptureRing with write(). A drain thread
+    follows the absolute frame position of the capture and routes the frames that fall
+    inside a registered segment to that segment's ChannelDemuxer; frames between segments
+    are discarded. Segments have to be registered before the capture reaches their start
+    frame, which holds for begin_segment(capture.frames_captured, ...).
+    """
+    def __init__(self, channels:int, sampwidth:int, rate:int, capacity_frames=2**18, poll_interval=0.01) -> None:
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.rate = rate
+        self.poll_interval = poll_interval
+        self.ring = CaptureRing(capacity_frames, channels, dtype=SAMPLE_DTYPES[sampwidth])
+        self.segments = []
+        self.lock = threading.Lock()   # guards self.segments between control and drain threads
+        self.thread = None
+        self.stop_event = threading.Event()
+
+
+    @property
+    def frames_captured(self) -> int:
+        """ absolute position of the capture, in frames since start() """
+        return self.ring.frames_written
+
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+
+    def write(self, data:bytes):
+        """ called from the input callback, never blocks """
+        self.ring.write(data)
+
+
+    def begin_segment(self, start_frame:int, all_channels_path:str, channel_paths:dict) -> Segment:
+        demuxer = ChannelDemuxer(all_channels_path, channel_paths, channels=self.channels,
+                                 sampwidth=self.sampwidth, rate=self.rate)
+        demuxer.open()
+        with self.lock:
+            # frames already drained are gone, the segment cannot start before them
+            segment = Segment(max(start_frame, self.ring.frames_read), demuxer)
+            self.segments.append(segment)
+        return segment
+
+
+    def end_segment(self, segment:Segment, end_frame:int):
+        with self.lock:
+            segment.end_frame = max(end_frame, segment.start_frame)
+
+
+    def _drain(self) -> int:
+        position = self.ring.frames_read
+        drained = 0
+        # take the views before the segments: a segment registered in between starts after them
+        views = self.ring.views()
+        with self.lock:
+            segments = list(self.segments)
+        for view in views:
+            view_start = position + drained
+            view_end = view_start + len(view)
+            for segment in segments:
+                start = max(segment.start_frame, view_start)
+                end = view_end if segment.end_frame is None else min(segment.end_frame, view_end)
+                if start < end:
+                    segment.demuxer.write(view[start - view_start:end - view_start])
+                    segment.written_frames += end - start
+            drained += len(view)
+        self.ring.advance(drained)
+        self._close_finished(position + drained)
+        return drained
+
+
+    def _close_finished(self, position:int, force=False):
+        with self.lock:
+            finished = [s for s in self.segments if force or (s.end_frame is not None and s.end_frame <= position)]
+            self.segments = [s for s in self.segments if s not in finished]
+        for segment in finished:
+            segment.demuxer.close()
+            segment.done.set()
+
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            if self._drain() == 0:
+                self.stop_event.wait(self.poll_interval)
+        self._drain()
+
+
+    def close(self):
+        """ call once the input stream is stopped, flushes and closes any segment still open """
+        self.stop_event.set()
+        self.thread.join()
+        self._close_finished(self.ring.frames_read, force=True)
+
+
+    def stats(self) -> dict:
+        return {"captured_frames": self.ring.frames_written, "dropped_buffers": self.ring.overrun_buffers,
+                "dropped_frames": self.ring.overrun_frames}
@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import wave
+
+
+
+JOURNAL_NAME = "journal.jsonl"
+
+
+class SessionJournal():
+    """ Append-only checkpoint journal of a PlayerRecorder session.
+
+    The first record holds the planned playlist, then one record is appended per completed
+    track once all its files are closed. Every record is a single JSON line written and
+    fsynced in one go, so after a crash the journal is either complete or ends with one
+    torn line, which load() ignores.
+    """
+    def __init__(self, save_dir:str) -> None:
+        self.save_dir = save_dir
+        self.path = os.path.join(save_dir, JOURNAL_NAME)
+        self.plan = None
+        self.completed = []
+
+
+    def _append(self, record:dict):
+        with open(self.path, "a", encoding="utf-8") as out_file:
+            out_file.write(json.dumps(record) + "\n")
+            out_file.flush()
+            os.fsync(out_file.fileno())
+
+
+    def start(self, participant_id:int, ds_type:str, playlist:list, budget:float):
+        self.plan = {"event": "plan", "participant_id": participant_id, "ds_type": ds_type,
+                     "budget": budget, "playlist": playlist}
+        self.completed = []
+        self._append(self.plan)
+
+
+    def track_done(self, recording:int, path:str, duration:float):
+        record = {"event": "track", "recording": recording, "path": str(path), "duration": duration}
+        self.completed.append(record)
+        self._append(record)
+
+
+    def load(self) -> "SessionJournal":
+        tracks = {}
+        with open(self.path, "r", encoding="utf-8") as in_file:
+            for line in in_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break   # torn last line of a crashed session
+                if record["event"] == "plan":
+                    self.plan = record
+                elif record["event"] == "track":
+                    # a track recorded again after a resume replaces the earlier record
+                    tracks[record["recording"]] = record
+        self.completed = [tracks[recording] for recording in sorted(tracks)]
+        if self.plan is None:
+            raise ValueError(f"No playlist in {self.path}")
+        return self
+
+
+    @property
+    def elapsed(self) -> float:
+        return sum(record["duration"] for record in self.completed)
+
+
+
+def is_valid_recording(output_dir:str) -> bool:
+    """ every WAV of a track directory has a consistent header and at least one frame """
+    wav_names = [name for name in os.listdir(output_dir) if name.endswith(".wav")] if os.path.isdir(output_dir) else []
+    if "all_channels.wav" not in wav_names:
+        return False
+    for name in wav_names:
+        try:
+            with wave.open(os.path.join(output_dir, name), "rb") as wf:
+                if wf.getnframes() == 0:
+                    return False
+        except (wave.Error, EOFError, OSError):
+            return False
+    return True
+
+
+def discard_partial_recordings(save_dir:str, journal:SessionJournal):
+    """ removes the directories of tracks started after the last journaled one, and drops the last
+    journaled track too when its files do not validate (it is then recorded again) """
+    while journal.completed and not is_valid_recording(os.path.join(save_dir, str(journal.completed[-1]["recording"]))):
+        journal.completed.pop()
+    last = journal.completed[-1]["recording"] if journal.completed else 0
+    for name in os.listdir(save_dir):
+        path = os.path.join(save_dir, name)
+        if name.isdigit() and int(name) > last and os.path.isdir(path):
+            print("Discarding partial recording", path)
+            shutil.rmtree(path)
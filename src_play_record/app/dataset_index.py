@@ -0,0 +1,136 @@
+import os
+import sqlite3
+import wave
+
+
+
+DATASET_INDEX_PATH = "external_recordings/dataset_index.sqlite"
+
+
+class DatasetIndex():
+    """ On-disk index of the WAV files of the audio datasets.
+
+    Stores path, duration, sample rate, channels and size of every file. refresh() only
+    lists the directories whose mtime changed since the last refresh (a directory mtime
+    changes when entries are added, removed or renamed in it), so a refresh of an
+    unchanged tree costs one stat per directory instead of a full crawl.
+    """
+    def __init__(self, db_path=DATASET_INDEX_PATH) -> None:
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY, root TEXT NOT NULL, parent TEXT, mtime_ns INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, root TEXT NOT NULL, dir TEXT NOT NULL, subfolder TEXT NOT NULL,
+                duration REAL NOT NULL, rate INTEGER NOT NULL, channels INTEGER NOT NULL,
+                size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS files_root_duration ON files (root, duration);
+            CREATE INDEX IF NOT EXISTS files_root_subfolder ON files (root, subfolder);
+            CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+            CREATE TABLE IF NOT EXISTS played (
+                path TEXT NOT NULL, root TEXT NOT NULL, participant_id INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS played_root ON played (root);
+        """)
+
+
+    def refresh(self, root:str) -> dict:
+        """ brings the index of `root` up to date, returns counts of what changed """
+        stats = {"dirs_scanned": 0, "added": 0, "removed": 0}
+        stored_dirs = {path: mtime for path, mtime in
+                       self.connection.execute("SELECT path, mtime_ns FROM dirs WHERE root = ?", (root,))}
+        seen_dirs = set()
+        stack = [(root, None)]
+        with self.connection:
+            while stack:
+                dirpath, parent = stack.pop()
+                try:
+                    mtime_ns = os.stat(dirpath).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                seen_dirs.add(dirpath)
+                if stored_dirs.get(dirpath) == mtime_ns:
+                    subdirs = [row[0] for row in
+                               self.connection.execute("SELECT path FROM dirs WHERE parent = ?", (dirpath,))]
+                else:
+                    subdirs = self._scan_dir(root, dirpath, stats)
+                    self.connection.execute("INSERT OR REPLACE INTO dirs (path, root, parent, mtime_ns) VALUES (?, ?, ?, ?)",
+                                            (dirpath, root, parent, mtime_ns))
+                stack.extend((subdir, dirpath) for subdir in subdirs)
+
+            for dirpath in set(stored_dirs) - seen_dirs:
+                stats["removed"] += self.connection.execute("DELETE FROM files WHERE dir = ?", (dirpath,)).rowcount
+                self.connection.execute("DELETE FROM dirs WHERE path = ?", (dirpath,))
+        return stats
+
+
+    def _scan_dir(self, root:str, dirpath:str, stats:dict) -> list:
+        stats["dirs_scanned"] += 1
+        indexed = {row[0]: (row[1], row[2]) for row in
+                   self.connection.execute("SELECT path, size, mtime_ns FROM files WHERE dir = ?", (dirpath,))}
+        subdirs = []
+        present = set()
+        subfolder = os.path.relpath(dirpath, root)
+        for entry in os.scandir(dirpath):
+            if entry.is_dir():
+                subdirs.append(entry.path)
+                continue
+            if not entry.name.lower().endswith(".wav"):
+                continue
+            present.add(entry.path)
+            stat = entry.stat()
+            if indexed.get(entry.path) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            try:
+                with wave.open(entry.path, "rb") as wf:
+                    rate, channels, nframes = wf.getframerate(), wf.getnchannels(), wf.getnframes()
+            except (wave.Error, EOFError) as exc:
+                print("Skipping unreadable file", entry.path, exc)
+                continue
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (path, root, dir, subfolder, duration, rate, channels, size, mtime_ns) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry.path, root, dirpath, "" if subfolder == "." else subfolder, nframes / float(rate), rate,
+                 channels, stat.st_size, stat.st_mtime_ns))
+            stats["added"] += 1
+
+        for path in set(indexed) - present:
+            self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+            stats["removed"] += 1
+        return subdirs
+
+
+    def query(self, root:str, min_duration=None, max_duration=None, subfolder=None) -> list:
+        """ rows (path, subfolder, duration, rate, channels, size) of the files of `root`, optionally
+        filtered by duration range (seconds) and subfolder (the subfolder and everything below it) """
+        sql = "SELECT path, subfolder, duration, rate, channels, size FROM files WHERE root = ?"
+        params = [root]
+        if min_duration is not None:
+            sql += " AND duration >= ?"
+            params.append(min_duration)
+        if max_duration is not None:
+            sql += " AND duration <= ?"
+            params.append(max_duration)
+        if subfolder is not None:
+            sql += " AND (subfolder = ? OR subfolder LIKE ? ESCAPE '\\')"
+            escaped = subfolder.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.extend([subfolder, escaped + os.sep + "%"])
+        sql += " ORDER BY path"
+        return self.connection.execute(sql, params).fetchall()
+
+
+    def mark_played(self, root:str, paths:list, participant_id:int):
+        with self.connection:
+            self.connection.executemany("INSERT INTO played (path, root, participant_id) VALUES (?, ?, ?)",
+                                        [(str(path), root, participant_id) for path in paths])
+
+
+    def played_paths(self, root:str) -> set:
+        """ files of `root` already recorded for an earlier participant """
+        return {row[0] for row in self.connection.execute("SELECT DISTINCT path FROM played WHERE root = ?", (root,))}
+
+
+    def close(self):
+        self.connection.close()
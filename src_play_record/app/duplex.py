@@ -0,0 +1,72 @@
+import threading
+import numpy as np
+import pyaudio
+from app.capture import SegmentedCapture
+
+
+
+class DuplexPlayback():
+    """ Callback of a full-duplex stream: captures the input and plays the current track.
+
+    Input and output buffers of a duplex callback cover the same stream frames, so the
+    capture position at which the first frame of a track is handed to PortAudio is the
+    exact offset of original.wav inside the session capture (up to the constant
+    input + output latency of the device, reported by the stream).
+    """
+    def __init__(self, capture:SegmentedCapture, channels:int, sampwidth:int, rate:int) -> None:
+        self.capture = capture
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.rate = rate
+        self.wf = None
+        self.track_channels = None
+        self.start_frame = None
+        self.end_frame = None
+        self.done = threading.Event()
+        # output of the callback, grown when PortAudio asks for a larger buffer and refilled in place
+        self.out = np.zeros((0, channels), dtype=f"<i{sampwidth}")
+
+
+    def start_track(self, wf):
+        """ wf: wave reader of the track, handed over to the callback until it is exhausted """
+        if wf.getframerate() != self.rate or wf.getsampwidth() != self.sampwidth:
+            raise ValueError(f"Track format {wf.getframerate()} Hz/{wf.getsampwidth()} bytes does not match "
+                             f"the duplex stream ({self.rate} Hz/{self.sampwidth} bytes)")
+        if wf.getnchannels() > self.channels:
+            raise ValueError(f"Track has {wf.getnchannels()} channels, duplex stream only {self.channels}")
+        self.track_channels = wf.getnchannels()
+        self.start_frame = None
+        self.end_frame = None
+        self.done.clear()
+        self.wf = wf
+
+
+    def wait(self, timeout=None) -> bool:
+        """ blocks until the last frame of the track has been handed to PortAudio """
+        return self.done.wait(timeout)
+
+
+    def callback(self, in_data, frame_count, time_info, status):
+        position = self.capture.frames_captured
+        self.capture.write(in_data)
+
+        if len(self.out) < frame_count:
+            self.out = np.zeros((frame_count, self.channels), dtype=self.out.dtype)
+        out = self.out[:frame_count]
+        played = 0
+        wf = self.wf
+        if wf is not None:
+            if self.start_frame is None:
+                self.start_frame = position
+            frames = np.frombuffer(wf.readframes(frame_count), dtype=out.dtype).reshape(-1, self.track_channels)
+            played = len(frames)
+            out[:played, :self.track_channels] = frames
+            # a wider track may have written there before
+            out[:played, self.track_channels:] = 0
+            if played < frame_count:
+                self.end_frame = position + played
+                self.wf = None
+                self.done.set()
+        out[played:] = 0
+        # PyAudio only takes bytes back, the one copy of the callback
+        return (out.tobytes(), pyaudio.paContinue)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import shutil
+from argparse import ArgumentParser
+
+
+
+ORIGINALS_DIR = "external_recordings/originals"
+HASH_CACHE_NAME = "hash_cache.json"
+CHUNK_SIZE = 2**20
+
+
+class OriginalsStore():
+    """ Content-addressed store of the played originals.
+
+    Every file is stored once under its SHA-256 (root/ab/abcdef....wav) and referenced
+    from the recording directories by a hardlink, or by a small JSON manifest on file
+    systems without hardlinks. Digests are cached by (size, mtime) so that a dataset
+    file is hashed only once, across sessions.
+    """
+    def __init__(self, root=ORIGINALS_DIR) -> None:
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self.cache_path = os.path.join(self.root, HASH_CACHE_NAME)
+        self.hash_cache = {}
+        if os.path.isfile(self.cache_path):
+            with open(self.cache_path, "r", encoding="utf-8") as in_file:
+                self.hash_cache = json.load(in_file)
+
+
+    def save_cache(self):
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as out_file:
+            json.dump(self.hash_cache, out_file)
+        os.replace(tmp_path, self.cache_path)
+
+
+    def digest(self, path) -> str:
+        path = os.path.abspath(str(path))
+        stat = os.stat(path)
+        cached = self.hash_cache.get(path)
+        if cached is not None and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+
+        sha = hashlib.sha256()
+        with open(path, "rb") as in_file:
+            for chunk in iter(lambda: in_file.read(CHUNK_SIZE), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        self.hash_cache[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+        return digest
+
+
+    def blob_path(self, digest:str, suffix=".wav") -> str:
+        return os.path.join(self.root, digest[:2], digest + suffix)
+
+
+    def add(self, path) -> str:
+        """ stores the file if its content is not in the store yet, returns the path of the blob """
+        digest = self.digest(path)
+        blob = self.blob_path(digest, suffix=os.path.splitext(str(path))[1])
+        if not os.path.isfile(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp_path = blob + ".tmp"
+            shutil.copyfile(str(path), tmp_path)
+            os.replace(tmp_path, blob)
+        return blob
+
+
+    def link(self, path, dest:str) -> str:
+        """ makes `dest` refer to the stored copy of `path`: a hardlink when possible, otherwise a
+        `<dest>.json` manifest pointing to the blob. Returns the path that was written. """
+        blob = self.add(path)
+        try:
+            if os.path.lexists(dest):
+                os.remove(dest)
+            os.link(blob, dest)
+            return dest
+        except OSError:
+            manifest_path = os.path.splitext(dest)[0] + ".json"
+            with open(manifest_path, "w", encoding="utf-8") as out_file:
+                json.dump({"sha256": os.path.basename(os.path.splitext(blob)[0]),
+                           "blob": os.path.relpath(blob, os.path.dirname(dest)),
+                           "source": str(path)}, out_file, indent=2)
+            return manifest_path
+
+
+    def dedupe(self, tree:str, filename="original.wav") -> dict:
+        """ replaces every `filename` below `tree` by a hardlink to its blob, in place """
+        stats = {"files": 0, "deduped": 0, "bytes_saved": 0, "failed": 0}
+        store_root = os.path.abspath(self.root)
+        for dirpath, dirnames, filenames in os.walk(tree):
+            if os.path.abspath(dirpath).startswith(store_root):
+                dirnames[:] = []
+                continue
+            if filename not in filenames:
+                continue
+            path = os.path.join(dirpath, filename)
+            stats["files"] += 1
+            blob = self.blob_path(self.digest(path), suffix=os.path.splitext(filename)[1])
+            try:
+                if not os.path.isfile(blob):
+                    # the first copy becomes the blob, nothing to copy
+                    os.makedirs(os.path.dirname(blob), exist_ok=True)
+                    os.link(path, blob)
+                elif not os.path.samefile(path, blob):
+                    size = os.path.getsize(path)
+                    tmp_path = path + ".dedupe"
+                    os.link(blob, tmp_path)
+                    os.replace(tmp_path, path)
+                    stats["deduped"] += 1
+                    stats["bytes_saved"] += size
+            except OSError as exc:
+                print("Could not dedupe", path, exc)
+                stats["failed"] += 1
+        self.save_cache()
+        return stats
+
+
+
+def parse_args():
+    parser = ArgumentParser(description="Dedupe the played originals of existing recordings in place")
+    parser.add_argument("tree", nargs="?", default="external_recordings",
+                        help="Recordings tree to scan for original.wav files")
+    parser.add_argument("--store", default=ORIGINALS_DIR, help="Root of the originals store")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    store = OriginalsStore(args.store)
+    print(store.dedupe(args.tree))
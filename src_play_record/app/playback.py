@@ -0,0 +1,238 @@
+import struct
+import threading
+import wave
+import numpy as np
+
+PAGE_SIZE = 4096
+
+
+
+class PcmTrack():
+    """ A WAV track whose PCM payload is held in memory (or memory-mapped), read through
+    the wave.Wave_read API.
+
+    readframes() returns memoryview slices of the payload, so a read never touches the disk.
+    PyAudio only takes bytes back from a callback, so playing a buffer still costs one copy
+    of that buffer, never of the whole payload.
+    """
+    def __init__(self, path, data, channels:int, sampwidth:int, rate:int) -> None:
+        self.path = path
+        self.data = memoryview(data).cast("B")
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.rate = rate
+        self.frame_size = channels * sampwidth
+        self.nframes = self.data.nbytes // self.frame_size
+        self.position = 0
+
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+
+    def getnchannels(self) -> int:
+        return self.channels
+
+
+    def getsampwidth(self) -> int:
+        return self.sampwidth
+
+
+    def getframerate(self) -> int:
+        return self.rate
+
+
+    def getnframes(self) -> int:
+        return self.nframes
+
+
+    def rewind(self):
+        self.position = 0
+
+
+    def readframes(self, frame_count:int) -> memoryview:
+        start = self.position
+        self.position = min(start + frame_count, self.nframes)
+        return self.data[start * self.frame_size:self.position * self.frame_size]
+
+
+    def close(self):
+        # the payload is owned by the prefetcher, which drops it once the track is done
+        self.position = self.nframes
+
+
+
+def payload_size(path) -> int:
+    """ size in bytes of the PCM payload, from the header only """
+    with wave.open(str(path), "rb") as wf:
+        return wf.getnframes() * wf.getnchannels() * wf.getsampwidth()
+
+
+def load_track(path) -> PcmTrack:
+    with wave.open(str(path), "rb") as wf:
+        data = wf.readframes(wf.getnframes())
+        return PcmTrack(path, data, channels=wf.getnchannels(), sampwidth=wf.getsampwidth(),
+                        rate=wf.getframerate())
+
+
+def parse_wav_header(path) -> dict:
+    """ walks the RIFF chunks of a PCM WAV file, returns its format and the position of the data chunk """
+    fmt = None
+    with open(path, "rb") as in_file:
+        riff = in_file.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            raise wave.Error(f"{path} is not a RIFF/WAVE file")
+        while True:
+            chunk_header = in_file.read(8)
+            if len(chunk_header) < 8:
+                raise wave.Error(f"{path} has no data chunk")
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+            if chunk_id == b"fmt ":
+                fmt_data = in_file.read(chunk_size)
+                if len(fmt_data) < 16:
+                    raise wave.Error(f"{path} has a truncated fmt chunk")
+                audio_format, channels, rate, _, _, bits = struct.unpack("<HHIIHH", fmt_data[:16])
+                # 0xFFFE is WAVE_FORMAT_EXTENSIBLE, its PCM subformat starts with the same tag
+                if audio_format == 0xFFFE:
+                    if len(fmt_data) < 26:
+                        raise wave.Error(f"{path} has a truncated WAVE_FORMAT_EXTENSIBLE fmt chunk")
+                    audio_format = struct.unpack("<H", fmt_data[24:26])[0]
+                if audio_format != 1:
+                    raise wave.Error(f"{path} is not PCM (format {audio_format})")
+                if bits == 0 or bits % 8:
+                    raise wave.Error(f"{path} has an unsupported sample width ({bits} bits)")
+                if channels == 0:
+                    raise wave.Error(f"{path} has no channels")
+                fmt = {"channels": channels, "rate": rate, "sampwidth": bits // 8}
+                if chunk_size % 2:
+                    in_file.seek(1, 1)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise wave.Error(f"{path} has its data chunk before the fmt chunk")
+                offset = in_file.tell()
+                file_size = in_file.seek(0, 2)
+                # truncated recordings often keep the size of the full chunk in the header
+                fmt.update(offset=offset, size=min(chunk_size, file_size - offset))
+                return fmt
+            else:
+                in_file.seek(chunk_size + chunk_size % 2, 1)
+
+
+def map_track(path, warm=True) -> PcmTrack:
+    """ memory-maps the PCM payload instead of reading it; with warm=True every page is touched
+    once so the playback callback does not fault on the disk """
+    header = parse_wav_header(str(path))
+    frame_size = header["channels"] * header["sampwidth"]
+    size = header["size"] - header["size"] % frame_size
+    if size == 0:
+        data = b""
+    else:
+        data = np.memmap(str(path), dtype=np.uint8, mode="r", offset=header["offset"], shape=(size,))
+        if warm:
+            int(data[::PAGE_SIZE].sum())
+    return PcmTrack(path, data, channels=header["channels"], sampwidth=header["sampwidth"], rate=header["rate"])
+
+
+
+class TrackPrefetcher():
+    """ Loads the next `depth` playlist entries into memory on a background thread.
+
+    Tracks are loaded in playlist order while the loaded payloads stay under max_bytes;
+    the track the player is waiting for is always loaded, even when it alone exceeds the
+    cap. get(index) hands a track to the player and drops every earlier one.
+    """
+    def __init__(self, filenames:list, depth=3, max_bytes=256 * 2**20, loader=load_track, sizer=payload_size) -> None:
+        self.filenames = filenames
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.sizer = sizer
+        self.tracks = {}          # playlist index -> loaded track, or the exception raised while loading it
+        self.loaded_bytes = 0
+        self.next_index = 0       # first index the player still needs
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = None
+
+
+    def start(self, first_index:int):
+        self.next_index = first_index
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.tracks = {}
+        self.loaded_bytes = 0
+
+
+    def _pending_index(self):
+        end = min(self.next_index + self.depth, len(self.filenames))
+        for index in range(self.next_index, end):
+            if index not in self.tracks:
+                return index
+        return None
+
+
+    def _run(self):
+        while True:
+            with self.condition:
+                index = self._pending_index()
+                while not self.stopped and index is None:
+                    self.condition.wait()
+                    index = self._pending_index()
+                if self.stopped:
+                    return
+
+            path = self.filenames[index]
+            try:
+                size = self.sizer(path)
+            except Exception:
+                size = 0    # the loader raises the actual error
+
+            with self.condition:
+                # wait for the player to release memory, unless it is waiting for this very track
+                while not self.stopped and index > self.next_index and self.loaded_bytes + size > self.max_bytes:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                if index < self.next_index:
+                    continue
+
+            try:
+                track = self.loader(path)
+            except Exception as exc:
+                # any failure, e.g. struct.error on a malformed header, is handed to get()
+                track = exc
+
+            with self.condition:
+                if index >= self.next_index:
+                    self.tracks[index] = track
+                    if not isinstance(track, Exception):
+                        self.loaded_bytes += track.nbytes
+                self.condition.notify_all()
+
+
+    def get(self, index:int):
+        """ blocks until the track at `index` is in memory """
+        with self.condition:
+            self.next_index = index
+            for old in [i for i in self.tracks if i < index]:
+                track = self.tracks.pop(old)
+                if not isinstance(track, Exception):
+                    self.loaded_bytes -= track.nbytes
+            self.condition.notify_all()
+            while index not in self.tracks and not self.stopped:
+                self.condition.wait()
+            track = self.tracks.get(index)
+        if isinstance(track, Exception):
+            raise track
+        if track is None:
+            raise RuntimeError("Prefetcher stopped before the track was loaded")
+        return track
@@ -1,17 +1,25 @@
 from enum import Enum
 import os 
 import pyaudio 
-from scipy.io import wavfile
-import wave 
 import glob
 import time
-import shutil
 from PyQt5.QtWidgets import QWidget
 from pathlib import Path 
-import random
+import json
+import threading
+from argparse import ArgumentParser
 
 from PyQt5.QtCore import QThread
-import pandas as pd
+from audio_common.wav_writer import StreamingWavWriter
+from app.capture import SegmentedCapture
+from app.duplex import DuplexPlayback
+from app.playback import TrackPrefetcher, load_track, map_track
+from app.originals_store import OriginalsStore
+from audio_common.participants import ParticipantRegistry
+from app.dataset_index import DatasetIndex
+from app.playlist import plan_playlist, save_playlist
+from audio_common.devices import DeviceCatalog
+from app.checkpoint import SessionJournal, discard_partial_recordings
 
 
 # DEBUG
@@ -34,14 +42,16 @@ OUT_CHANNELS = 2
 
 MAX_RECORDING_TIME = 1 * 3600 #seconds
 
-def explore_devices(name):
-  # establish index of input device for sound card
-  pa = pyaudio.PyAudio()
-  for id in range(pa.get_device_count()):
-      dev_dict = pa.get_device_info_by_index(id)
-      if dev_dict["name"] == name:
-        print("Found: ", dev_dict)
-        return dev_dict
+# upcoming playlist entries kept in memory while the current track plays
+PREFETCH_TRACKS = 3
+PREFETCH_MAX_BYTES = 256 * 2**20
+# "mmap": map the PCM payload of the WAV files, "memory": read it into a buffer
+PLAYBACK_SOURCE = "mmap"
+
+PARTICIPANTS_DB_PATH = "external_recordings/participants.sqlite"
+PARTICIPANTS_CSV_PATH = "external_recordings/participants.csv"
+
+DEVICE_PROFILE_PATH = "external_recordings/device_profile.json"
 
 
 class DatasetType(Enum):
@@ -49,88 +59,204 @@ class DatasetType(Enum):
     NOISE = "noise"
 
 
+INPUT_DIRS = {
+    DatasetType.NOISE: "audio_datasets/datasets_fullband/noise_fullband",
+    DatasetType.SPEECH: "audio_datasets/datasets_fullband/clean_fullband",
+}
+
+
 class PlayerRecorder():
 
-    def __init__(self) -> None:
+    def __init__(self, continuous_capture=True, duplex=False) -> None:
         self.current_recording = 0
         self.save_dir = None
         self.input_dir = None
         self.rate = 44100
         self.in_device_name = IN_DEVICE_NAME
         self.out_device_name = OUT_DEVICE_NAME
-        dev_dict = explore_devices(name=self.in_device_name)
-        if dev_dict is None:
+        self.in_channels = IN_CHANNELS
+        self.out_channels = OUT_CHANNELS
+        self.format = pyaudio.paInt16
+        # DEBUG
+        self.capture_rate = 48000 #self.rate
+
+        # a single PortAudio instance serves both the playback and the recording streams
+        self.catalog = DeviceCatalog.shared(DEVICE_PROFILE_PATH)
+        self.pa_record = self.catalog.pa
+        self.pa_play = self.catalog.pa
+
+        in_dev_dict = self.catalog.find(self.in_device_name)
+        if in_dev_dict is None:
             raise ValueError(f"Device with name: {self.in_device_name} not found.")
-        self.in_device_idx = dev_dict["index"]
+        self.in_device_idx = in_dev_dict["index"]
 
-        dev_dict = explore_devices(name=self.out_device_name)
-        if dev_dict is None:
+        out_dev_dict = self.catalog.find(self.out_device_name)
+        if out_dev_dict is None:
             raise ValueError(f"Device with name: {self.out_device_name} not found.")
-        self.out_device_idx = dev_dict["index"]
+        self.out_device_idx = out_dev_dict["index"]
 
+        if not self.catalog.supports(in_dev_dict, rate=self.capture_rate, channels=self.in_channels, fmt=self.format):
+            raise ValueError(f"Device {self.in_device_name} does not support {self.in_channels} input channels")
+
+        # duplex: a single stream on one device plays the tracks and captures the input, giving
+        # the exact offset of every track inside the capture (written to alignment.json)
+        self.duplex = duplex
+        if self.duplex:
+            if self.in_device_idx != self.out_device_idx:
+                raise ValueError("Duplex mode needs the same input and output device")
+            if not self.catalog.supports(out_dev_dict, rate=self.capture_rate, channels=self.in_channels,
+                                         fmt=self.format, is_input=False):
+                raise ValueError(f"Device {self.out_device_name} does not support {self.in_channels} output channels")
 
-        self.in_channels = IN_CHANNELS
-        self.out_channels = OUT_CHANNELS
         self.input_filenames = None
-        self.pa_record = pyaudio.PyAudio()
-        self.pa_play = pyaudio.PyAudio()
+        self.playlist = None
+        self.prefetcher = None
+        self.originals = None
+        self.index = None
         self.recording_time = 0
+        # continuous_capture: one input stream for the whole session, tracks are cut from it
+        # by the capture position at playback start and end
+        self.continuous_capture = continuous_capture or duplex
+        self.capture = None
+        self.duplex_playback = None
+
+        # set by the playback callback when it hands over the last buffer of the track
+        self.play_finished = threading.Event()
+        self.play_end_time = None
+        # time between the last frame of a track reaching the DAC and the start of the next track
+        self.track_end_clock = None
+        self.turnaround_times = []
+        self.segment = None
+        self.tail_padding_frames = 0
+        # progress of the session in save_dir, see resume()
+        self.journal = None
+        self.track_duration = None
 
 
 
     def set_dataset_type(self, ds_type:DatasetType):
         self.dataset_type = ds_type 
-        df = pd.read_csv("external_recordings/participants.csv")
-        num_participant = len(df)
-        self.participant_id = num_participant
-        self.save_dir = os.path.join("external_recordings", ds_type.value, str(num_participant))
+        registry = ParticipantRegistry(PARTICIPANTS_DB_PATH, PARTICIPANTS_CSV_PATH, fields=["ds_type"])
+        self.participant_id = registry.register({"ds_type": ds_type.value})
+        registry.close()
+        self.save_dir = os.path.join("external_recordings", ds_type.value, str(self.participant_id))
         if not os.path.isdir(self.save_dir):
             os.mkdir(self.save_dir)
 
-        df = df.append({"participant_id": self.participant_id, "ds_type": ds_type.value}, ignore_index=True)
-        df.to_csv("external_recordings/participants.csv", index=False)
-
-        if ds_type == DatasetType.NOISE:
-            self.input_dir = "audio_datasets/datasets_fullband/noise_fullband"
-
-        elif ds_type == DatasetType.SPEECH:
-            self.input_dir = "audio_datasets/datasets_fullband/clean_fullband"
-
-        else:
+        if ds_type not in INPUT_DIRS:
             raise ValueError("Invalid Dataset Type:", ds_type.name)
-        self.input_filenames = list(Path(self.input_dir).rglob("*.wav"))
-        random.shuffle(self.input_filenames)
+        self.input_dir = INPUT_DIRS[ds_type]
+        # incremental refresh, only the directories that changed since the last session are listed
+        index = DatasetIndex()
+        index.refresh(self.input_dir)
+        self.playlist = plan_playlist(index.query(self.input_dir), budget=MAX_RECORDING_TIME,
+                                      played=index.played_paths(self.input_dir))
+        index.close()
+        save_playlist(self.playlist, MAX_RECORDING_TIME, self.save_dir)
+        self.journal = SessionJournal(self.save_dir)
+        self.journal.start(self.participant_id, ds_type.value, self.playlist, MAX_RECORDING_TIME)
+        self.input_filenames = [Path(clip["path"]) for clip in self.playlist]
+        print("Planned", len(self.playlist), "tracks,", sum(clip["duration"] for clip in self.playlist), "s")
+
+
+    def resume(self, save_dir:str):
+        """ continues the interrupted session of save_dir (instead of set_dataset_type) at its first
+        incomplete track, with the playlist and the time already played of the journal """
+        self.journal = SessionJournal(save_dir).load()
+        discard_partial_recordings(save_dir, self.journal)
+        self.save_dir = save_dir
+        self.dataset_type = DatasetType(self.journal.plan["ds_type"])
+        self.input_dir = INPUT_DIRS[self.dataset_type]
+        self.participant_id = self.journal.plan["participant_id"]
+        self.playlist = self.journal.plan["playlist"]
+        self.input_filenames = [Path(clip["path"]) for clip in self.playlist]
+        self.current_recording = len(self.journal.completed)
+        self.recording_time = self.journal.elapsed
+        print("Resuming at track", self.current_recording + 1, "of", len(self.playlist), ",",
+              self.journal.plan["budget"] - self.recording_time, "s of budget left")
 
 
 
     def _play_callback(self, in_data, frame_count, time_info, status):
-        data = self.wf.readframes(frame_count)
+        # PyAudio only takes bytes back from a callback, not the memoryview of a PcmTrack
+        data = bytes(self.wf.readframes(frame_count))
+        if len(data) < frame_count * self.wf_frame_size:
+            # last buffer: PortAudio plays it out and stops, wake the loop when its last frame reaches the DAC
+            dac_time = time_info["output_buffer_dac_time"] or \
+                time_info["current_time"] + self.stream_out.get_output_latency()
+            self.play_end_time = dac_time + len(data) / self.wf_frame_size / self.wf.getframerate()
+            self.play_finished.set()
+            return (data, pyaudio.paComplete)
         return (data, pyaudio.paContinue)
 
 
         
     def start_playing_loop(self):
-        self.playing = True
+        self.playing = self.current_recording < len(self.input_filenames)
+        loader = map_track if PLAYBACK_SOURCE == "mmap" else load_track
+        self.prefetcher = TrackPrefetcher(self.input_filenames, depth=PREFETCH_TRACKS, max_bytes=PREFETCH_MAX_BYTES,
+                                          loader=loader)
+        self.prefetcher.start(self.current_recording)
+        self.originals = OriginalsStore()
+        # opened once for the session, on the thread of the loop (tracks are marked played in it)
+        self.index = DatasetIndex()
+        if self.continuous_capture:
+            self._start_session_capture()
         while self.playing:
             self._start_recording()
             self._start_playing()
             self._stop_playing()
             self._stop_recording()
-            print("Current recording:", self.current_recording, "playing time:", self.recording_time)
+            print("Current recording:", self.current_recording, "playing time:", self.recording_time,
+                  "turnaround (s):", self.turnaround_times[-1] if self.turnaround_times else None)
+        if self.continuous_capture:
+            self._stop_session_capture()
+        self.prefetcher.stop()
+        self.originals.save_cache()
+        self.index.close()
 
 
     def stop_playing_loop(self):
         self.playing = False
 
 
-    def _start_playing(self):
-        self.in_filename = self.input_filenames[self.current_recording]
-        self.wf = wave.open(str(self.in_filename), "rb")
+    def get_turnaround_stats(self) -> dict:
+        """ latency between the end of a track and the start of the next one, in seconds """
+        if not self.turnaround_times:
+            return {"count": 0, "mean": None, "max": None}
+        return {"count": len(self.turnaround_times),
+                "mean": sum(self.turnaround_times) / len(self.turnaround_times),
+                "max": max(self.turnaround_times)}
+
 
-        self.recording_time += self.wf.getnframes() / float(self.wf.getframerate())
-        if self.recording_time > MAX_RECORDING_TIME:
+    def _mark_track_start(self):
+        if self.track_end_clock is not None:
+            self.turnaround_times.append(time.perf_counter() - self.track_end_clock)
+
+
+    def _start_playing(self):
+        # current_recording counts from 1, the playlist from 0
+        self.in_filename = self.input_filenames[self.current_recording - 1]
+        # served from memory, loaded ahead of time by the prefetcher
+        self.wf = self.prefetcher.get(self.current_recording - 1)
+
+        self.track_duration = self.wf.getnframes() / float(self.wf.getframerate())
+        self.recording_time += self.track_duration
+        # the playlist is planned to fit MAX_RECORDING_TIME, the session ends with it
+        if self.current_recording >= len(self.input_filenames):
             self.playing = False
 
+        if self.duplex:
+            self.segment = self.capture.begin_segment(self.capture.frames_captured,
+                                                      os.path.join(self.output_dir, "all_channels.wav"),
+                                                      self._get_channel_paths())
+            self._mark_track_start()
+            self.duplex_playback.start_track(self.wf)
+            return
+
+        self.wf_frame_size = self.wf.getsampwidth() * self.wf.getnchannels()
+        self.play_finished.clear()
+        self.play_end_time = None
         self.stream_out = self.pa_play.open(format=self.pa_play.get_format_from_width(self.wf.getsampwidth()),
                 channels=self.wf.getnchannels(),
                 rate=self.wf.getframerate(),
@@ -138,86 +264,187 @@ class PlayerRecorder():
                 output_device_index=self.out_device_idx,
                 stream_callback=self._play_callback)
 
+        if self.continuous_capture:
+            self.segment = self.capture.begin_segment(self.capture.frames_captured,
+                                                      os.path.join(self.output_dir, "all_channels.wav"),
+                                                      self._get_channel_paths())
+        self._mark_track_start()
         self.stream_out.start_stream()
 
 
     def _stop_playing(self):
-        while self.stream_out.is_active():
-            time.sleep(0.05)
-
+        if self.duplex:
+            self.duplex_playback.wait()
+            self.track_end_clock = time.perf_counter()
+            # the last frame handed to PortAudio comes back in the input one round trip later,
+            # the segment stays open until that tail is captured
+            self.tail_padding_frames = round((self.stream_in.get_input_latency() +
+                                              self.stream_in.get_output_latency()) * self.capture_rate)
+            self.capture.end_segment(self.segment, self.duplex_playback.end_frame + self.tail_padding_frames)
+            self.wf.close()
+            return
+
+        while not self.play_finished.wait(timeout=0.5):
+            # safety net, the stream can also end on an error without a last short buffer
+            if not self.stream_out.is_active():
+                break
+        if self.play_end_time is not None:
+            remaining = self.play_end_time - self.stream_out.get_time()
+            if remaining > 0:
+                time.sleep(remaining)
+        self.track_end_clock = time.perf_counter()
+
+        if self.continuous_capture:
+            self.capture.end_segment(self.segment, self.capture.frames_captured)
         self.stream_out.stop_stream()
         self.stream_out.close()
         self.wf.close()
 
     
     def _record_callback(self, in_data, frame_count, time_info, flag):
-        self.fulldata.append(in_data) #saves filtered data in an array
+        self.writer.write(in_data) # copied into the writer's preallocated ring
         return (in_data, pyaudio.paContinue)
 
 
 
-    def _start_recording(self):
-        self.current_recording += 1
-        self.format = pyaudio.paInt16
-        self.fulldata = []
-        
-        # DEBUG
-        self.pa_record.is_format_supported(rate=48000, #self.rate
-                            input_device=self.in_device_idx,
-                            input_channels=self.in_channels,
-                            input_format=self.format)
+    def _open_input_stream(self, callback):
+        stream_in = self.pa_record.open(
+            rate=self.capture_rate,
+            channels=self.in_channels,
+            format=self.format,
+            input=True,                   # input stream flag
+            input_device_index=self.in_device_idx,         # input device index
+            frames_per_buffer=1024,
+            stream_callback=callback
+        )
+        stream_in.start_stream()
+        return stream_in
 
 
-        # DEBUG
+    def _session_record_callback(self, in_data, frame_count, time_info, flag):
+        self.capture.write(in_data)
+        return (in_data, pyaudio.paContinue)
+
+
+    def _start_session_capture(self):
+        self.capture = SegmentedCapture(channels=self.in_channels,
+                                        sampwidth=self.pa_record.get_sample_size(self.format),
+                                        rate=self.capture_rate)
+        self.capture.start()
+        if not self.duplex:
+            self.stream_in = self._open_input_stream(self._session_record_callback)
+            return
+
+        self.duplex_playback = DuplexPlayback(self.capture, channels=self.in_channels,
+                                              sampwidth=self.pa_record.get_sample_size(self.format),
+                                              rate=self.capture_rate)
         self.stream_in = self.pa_record.open(
-            rate=48000, #self.rate
+            rate=self.capture_rate,
             channels=self.in_channels,
             format=self.format,
-            input=True,                   # input stream flag
-            input_device_index=self.in_device_idx,         # input device index
+            input=True,
+            output=True,
+            input_device_index=self.in_device_idx,
+            output_device_index=self.out_device_idx,
             frames_per_buffer=1024,
-            stream_callback=self._record_callback
+            stream_callback=self.duplex_playback.callback
         )
         self.stream_in.start_stream()
 
 
-    def _stop_recording(self):
+    def _stop_session_capture(self):
         self.stream_in.stop_stream()
         self.stream_in.close()
+        self.capture.close()
+        stats = self.capture.stats()
+        if stats["dropped_buffers"] > 0:
+            print("Capture could not keep up, dropped buffers:", stats)
+
+
+    def _get_channel_paths(self) -> dict:
+        return {
+            0: os.path.join(self.output_dir, "air_demo.wav"),
+            1: os.path.join(self.output_dir, "bone_demo.wav"),
+            # DEBUG
+            #2: os.path.join(self.output_dir, "air_reference.wav"),
+        }
+
+
+    def _start_recording(self):
+        self.current_recording += 1
+        self.output_dir = os.path.join(self.save_dir, f"{self.current_recording}")
+        if not os.path.isdir(self.output_dir):
+            os.mkdir(self.output_dir)
+
+        if self.continuous_capture:
+            # the segment is registered at playback start, see _start_playing
+            return
+
+        self.writer = StreamingWavWriter(os.path.join(self.output_dir, "all_channels.wav"),
+                                         channels=self.in_channels,
+                                         sampwidth=self.pa_record.get_sample_size(self.format),
+                                         rate=self.capture_rate,
+                                         channel_paths=self._get_channel_paths())
+        self.writer.start()
+        self.stream_in = self._open_input_stream(self._record_callback)
+
+
+    def _stop_recording(self):
+        if not self.continuous_capture:
+            self.stream_in.stop_stream()
+            self.stream_in.close()
         self._save_recording()
+        # a track counts as played only once it is recorded; marked before the journal entry
+        # so a crash in between replays it instead of leaving it unmarked (played is a multiset)
+        self.index.mark_played(self.input_dir, [self.in_filename], self.participant_id)
+        # only journaled once every file of the track is closed
+        self.journal.track_done(self.current_recording, self.in_filename, self.track_duration)
 
 
 
     def _save_recording(self):
-        output_dir = os.path.join(self.save_dir, f"{self.current_recording}")
-        if not os.path.isdir(output_dir):
-            os.mkdir(output_dir)
-
-        shutil.copy(self.in_filename, os.path.join(output_dir, "original.wav"))
-        output_path = os.path.join(output_dir, "all_channels.wav")
-        wav_file = wave.open(output_path, "wb")
-        wav_file.setnchannels(self.in_channels)        # number of channels
-        wav_file.setsampwidth(self.pa_record.get_sample_size(self.format))        # sample width in bytes
-        wav_file.setframerate(self.rate) 
-        wav_file.writeframes(b''.join(self.fulldata))
-        wav_file.close()
-
-        rate, all_channels = wavfile.read(output_path)
-
-        air_demo_path = os.path.join(output_dir, "air_demo.wav")
-        wavfile.write(air_demo_path, rate=rate, data=all_channels[:,0])
-        bone_demo_path = os.path.join(output_dir, "bone_demo.wav")
-        wavfile.write(bone_demo_path, rate=rate, data=all_channels[:,1])
-
-        # DEBUG
-        #air_reference_path = os.path.join(output_dir, "air_reference.wav")
-        #wavfile.write(air_reference_path, rate=rate, data=all_channels[:,2])
+        # stored once across participants, hardlinked into the recording directory
+        self.originals.link(self.in_filename, os.path.join(self.output_dir, "original.wav"))
+        if self.continuous_capture:
+            self.segment.wait()
+            if self.duplex:
+                self._save_alignment()
+            return
+        self.writer.close()
+        stats = self.writer.stats()
+        if stats["dropped_buffers"] > 0:
+            print("Writer could not keep up, dropped buffers:", stats)
+
+
+    def _save_alignment(self):
+        """ exact position of original.wav inside all_channels.wav, in frames at capture_rate """
+        alignment = {
+            "rate": self.capture_rate,
+            "segment_start_frame": self.segment.start_frame,
+            "segment_end_frame": self.segment.end_frame,
+            "playback_start_frame": self.duplex_playback.start_frame,
+            "playback_end_frame": self.duplex_playback.end_frame,
+            # segment_end_frame = playback_end_frame + tail_padding_frames (input + output latency)
+            "tail_padding_frames": self.tail_padding_frames,
+            "offset_frames": self.duplex_playback.start_frame - self.segment.start_frame,
+            "input_latency": self.stream_in.get_input_latency(),
+            "output_latency": self.stream_in.get_output_latency(),
+            "dropped_frames": self.capture.stats()["dropped_frames"],
+        }
+        with open(os.path.join(self.output_dir, "alignment.json"), "w") as out_file:
+            json.dump(alignment, out_file, indent=2)
 
 
 
 if __name__ == "__main__":
+    parser = ArgumentParser(description="Play the dataset tracks and record them")
+    parser.add_argument("--resume", default=None, help="Save directory of an interrupted session to continue")
+    args = parser.parse_args()
     player = PlayerRecorder()
-    player.set_dataset_type(DatasetType.SPEECH)
+    if args.resume is not None:
+        player.resume(args.resume)
+    else:
+        player.set_dataset_type(DatasetType.SPEECH)
     print("Participant:", player.participant_id)
     player.start_playing_loop()
     
\ No newline at end of file
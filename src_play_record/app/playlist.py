@@ -0,0 +1,87 @@
+import json
+import os
+import random
+import re
+from collections import deque
+
+
+
+# DNS read_speech keeps every speaker in one directory, the speaker is in the file name
+# (book_..._reader_06709_...wav); other datasets have a directory per speaker
+SPEAKER_PATTERN = re.compile(r"reader_\d+")
+
+
+def _speaker(clip:dict) -> str:
+    match = SPEAKER_PATTERN.search(os.path.basename(clip["path"]))
+    return match.group(0) if match else ""
+
+
+def _fill(pool:list, remaining:float, rng:random.Random, playlist:list) -> float:
+    """ round robin over the subfolders, and within a subfolder over the speakers of its file
+    names, taking from each the next clip that still fits.
+    A clip that does not fit never will (the remaining time only shrinks) and is dropped. """
+    groups = {}
+    for clip in pool:
+        groups.setdefault(clip["subfolder"], {}).setdefault(_speaker(clip), []).append(clip)
+    order = list(groups)
+    rng.shuffle(order)
+    rotations = {}
+    for key in order:
+        speakers = list(groups[key])
+        rng.shuffle(speakers)
+        rotations[key] = deque(speakers)
+        for clips in groups[key].values():
+            rng.shuffle(clips)
+
+    while order:
+        still_open = []
+        for key in order:
+            rotation = rotations[key]
+            while rotation:
+                group = groups[key][rotation.popleft()]
+                clip = None
+                while group:
+                    candidate = group.pop()
+                    if candidate["duration"] <= remaining:
+                        clip = candidate
+                        break
+                if group:
+                    rotation.append(_speaker(group[0]))
+                if clip is not None:
+                    playlist.append(clip)
+                    remaining -= clip["duration"]
+                    break
+            if rotation:
+                still_open.append(key)
+        order = still_open
+    return remaining
+
+
+def plan_playlist(candidates:list, budget:float, played=frozenset(), seed=None) -> list:
+    """ Builds a session playlist that fills `budget` seconds as tightly as possible.
+
+    candidates: rows with "path", "subfolder" and "duration" (e.g. DatasetIndex.query()).
+    Clips are taken one subfolder at a time, and one speaker at a time within a subfolder,
+    so that every subfolder and speaker is represented evenly; clips in `played` (already played to earlier participants) are only used once
+    the unplayed ones cannot fill the budget anymore.
+    """
+    rng = random.Random(seed)
+    clips = [{"path": str(row["path"]), "subfolder": row["subfolder"], "duration": row["duration"]}
+             for row in candidates]
+    fresh = [clip for clip in clips if clip["path"] not in played]
+    reused = [clip for clip in clips if clip["path"] in played]
+
+    playlist = []
+    remaining = _fill(fresh, budget, rng, playlist)
+    _fill(reused, remaining, rng, playlist)
+    rng.shuffle(playlist)
+    return playlist
+
+
+def save_playlist(playlist:list, budget:float, save_dir:str) -> str:
+    output_path = os.path.join(save_dir, "playlist.json")
+    with open(output_path, "w", encoding="utf-8") as out_file:
+        json.dump({"budget": budget,
+                   "expected_duration": sum(clip["duration"] for clip in playlist),
+                   "tracks": playlist}, out_file, indent=2)
+    return output_path
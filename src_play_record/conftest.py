@@ -0,0 +1 @@
+# Lets pytest import the `app` package as the application does, with src_play_record on the path.
@@ -0,0 +1,64 @@
+import struct
+import threading
+import wave
+
+import pytest
+
+from app.playback import TrackPrefetcher, map_track, parse_wav_header
+
+
+def write_wav(path, fmt_data, payload=b"\0" * 8):
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt_data)) + fmt_data
+    body += b"data" + struct.pack("<I", len(payload)) + payload
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+    return path
+
+
+def pcm_fmt(channels=1, rate=16000, bits=16):
+    block_align = channels * bits // 8
+    return struct.pack("<HHIIHH", 1, channels, rate, rate * block_align, block_align, bits)
+
+
+def get_with_timeout(prefetcher, index, timeout=5):
+    """ runs prefetcher.get on a helper thread, so a dead loader fails the test instead of hanging it """
+    outcome = {}
+    def target():
+        try:
+            outcome["track"] = prefetcher.get(index)
+        except Exception as exc:
+            outcome["error"] = exc
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "get() blocked on a track the loader failed to load"
+    return outcome
+
+
+@pytest.mark.parametrize("loader", ["load_track", "map_track"])
+@pytest.mark.parametrize("bad_fmt", [pcm_fmt()[:10], pcm_fmt(bits=0)], ids=["truncated", "zero_width"])
+def test_prefetcher_reraises_malformed_fmt_chunk(tmp_path, loader, bad_fmt):
+    good = write_wav(tmp_path / "good.wav", pcm_fmt())
+    bad = write_wav(tmp_path / "bad.wav", bad_fmt)
+    kwargs = {"loader": map_track} if loader == "map_track" else {}
+    prefetcher = TrackPrefetcher([str(bad), str(good)], **kwargs)
+    prefetcher.start(0)
+    try:
+        outcome = get_with_timeout(prefetcher, 0)
+        assert "error" in outcome
+        # the loader thread survived the failure and went on with the playlist
+        outcome = get_with_timeout(prefetcher, 1)
+        assert outcome["track"].getnframes() == 4
+    finally:
+        prefetcher.stop()
+
+
+def test_parse_wav_header_rejects_truncated_fmt_chunks(tmp_path):
+    with pytest.raises(wave.Error):
+        parse_wav_header(str(write_wav(tmp_path / "short.wav", pcm_fmt()[:10])))
+    extensible = struct.pack("<HHIIHH", 0xFFFE, 1, 16000, 32000, 2, 16) + b"\0" * 4
+    with pytest.raises(wave.Error):
+        parse_wav_header(str(write_wav(tmp_path / "extensible.wav", extensible)))
+    for bits in (0, 12):
+        with pytest.raises(wave.Error):
+            parse_wav_header(str(write_wav(tmp_path / f"{bits}_bits.wav", pcm_fmt(bits=bits))))
+    assert parse_wav_header(str(write_wav(tmp_path / "pcm.wav", pcm_fmt())))["sampwidth"] == 2
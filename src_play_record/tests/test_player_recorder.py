@@ -0,0 +1,35 @@
+import struct
+import threading
+
+import pytest
+
+pytest.importorskip("pyaudio")
+pytest.importorskip("PyQt5")
+
+from app.playback import load_track, map_track
+from app.player_recorder import PlayerRecorder
+
+
+def write_wav(path, frames):
+    fmt = struct.pack("<HHIIHH", 1, 1, 16000, 32000, 2, 16)
+    payload = b"\1\0" * frames
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(payload)) + payload
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+    return path
+
+
+@pytest.mark.parametrize("loader", [load_track, map_track])
+def test_play_callback_returns_bytes(tmp_path, loader):
+    # PyAudio parses the callback result with "z#", which rejects memoryviews: the stream
+    # would abort on its first buffer
+    recorder = PlayerRecorder.__new__(PlayerRecorder)
+    recorder.wf = loader(write_wav(tmp_path / "track.wav", 1500))
+    recorder.wf_frame_size = 2
+    recorder.play_finished = threading.Event()
+    recorder.stream_out = None
+
+    data, flag = recorder._play_callback(None, 1024, {"output_buffer_dac_time": 1.0, "current_time": 0.9}, 0)
+    assert type(data) is bytes and len(data) == 1024 * 2
+    data, flag = recorder._play_callback(None, 1024, {"output_buffer_dac_time": 1.1, "current_time": 1.0}, 0)
+    assert type(data) is bytes and len(data) == 476 * 2
+    assert recorder.play_finished.is_set()
@@ -0,0 +1,17 @@
+from collections import Counter
+
+from app.playlist import _speaker, plan_playlist
+
+
+def test_speakers_of_a_flat_directory_are_balanced():
+    # DNS read_speech layout: one directory, the speaker only in the file name
+    rows = [{"path": f"read_speech/book_{i:05d}_chp_0001_reader_{i % 4:05d}_0.wav", "subfolder": "read_speech",
+             "duration": 3.0} for i in range(100)]
+    # and one speaker with most of the clips
+    rows += [{"path": f"read_speech/book_{i:05d}_chp_0001_reader_09999_0.wav", "subfolder": "read_speech",
+              "duration": 3.0} for i in range(100, 1000)]
+    playlist = plan_playlist(rows, budget=30, seed=0)
+
+    assert sum(clip["duration"] for clip in playlist) == 30
+    speakers = Counter(_speaker(clip) for clip in playlist)
+    assert len(speakers) == 5 and max(speakers.values()) == 2
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import mmap
+import os
+from argparse import ArgumentParser
+
+import numpy as np
+
+
+
+COMPILED_DIR = "data/compiled"
+
+
+class CompiledCorpus():
+    """ Read-only view of a compiled corpus, sentences are decoded on access.
+
+    The compiled form of data/<language>.txt is a UTF-8 blob of its lines (<language>.utf8)
+    and an index (<language>.idx.npy) holding, per line, its byte offset and its word count
+    (one extra row for the end of the blob). Both are memory-mapped, so opening a language
+    costs no read of the corpus and a sentence is only decoded when it is shown.
+    The version is the SHA-256 of the blob: it only changes with the sentences, not with the
+    modification time or the encoding of the source.
+    """
+    def __init__(self, blob_path:str, index_path:str, version=None) -> None:
+        # identifies the source the corpus was compiled from, sentence ids are only stable within it
+        self.version = version
+        index = np.load(index_path, mmap_mode="r")
+        self.offsets = index[:, 0]
+        self.word_counts = index[:-1, 1]
+        self._file = open(blob_path, "rb")
+        # mmap refuses empty files
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] > 0 else b""
+
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+    def __getitem__(self, idx:int) -> str:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return self._blob[int(self.offsets[idx]):int(self.offsets[idx + 1])].decode("utf-8")
+
+
+    def close(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._file.close()
+
+
+
+def compiled_paths(language:str, compiled_dir=COMPILED_DIR) -> tuple:
+    return (os.path.join(compiled_dir, f"{language}.utf8"),
+            os.path.join(compiled_dir, f"{language}.idx.npy"),
+            os.path.join(compiled_dir, f"{language}.json"))
+
+
+def compile_corpus(source_path:str, encoding:str, language:str, compiled_dir=COMPILED_DIR):
+    """ writes the blob and the index of source_path, replaced atomically """
+    os.makedirs(compiled_dir, exist_ok=True)
+    blob_path, index_path, meta_path = compiled_paths(language, compiled_dir)
+    stat = os.stat(source_path)
+    rows = [[0, 0]]
+    digest = hashlib.sha256()
+    with open(source_path, "r", encoding=encoding) as in_file, open(blob_path + ".tmp", "wb") as out_file:
+        for line in in_file:
+            data = line.encode("utf-8")
+            out_file.write(data)
+            digest.update(data)
+            rows[-1][1] = len(line.split())
+            rows.append([rows[-1][0] + len(data), 0])
+    with open(index_path + ".tmp", "wb") as out_file:
+        np.save(out_file, np.array(rows, dtype=np.int64))
+    os.replace(blob_path + ".tmp", blob_path)
+    os.replace(index_path + ".tmp", index_path)
+    # written last: a crash in between leaves the corpus stale, and it is compiled again
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as out_file:
+        json.dump({"source": source_path, "encoding": encoding, "size": stat.st_size,
+                   "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest(), "sentences": len(rows) - 1},
+                  out_file)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def _read_meta(language:str, compiled_dir=COMPILED_DIR):
+    meta_path = compiled_paths(language, compiled_dir)[2]
+    if not os.path.isfile(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as in_file:
+        return json.load(in_file)
+
+
+def is_up_to_date(source_path:str, language:str, compiled_dir=COMPILED_DIR) -> bool:
+    meta = _read_meta(language, compiled_dir)
+    if meta is None or "sha256" not in meta:
+        return False
+    stat = os.stat(source_path)
+    return meta["size"] == stat.st_size and meta["mtime_ns"] == stat.st_mtime_ns
+
+
+def open_corpus(source_path:str, encoding:str, language:str, compiled_dir=COMPILED_DIR) -> CompiledCorpus:
+    """ the compiled corpus of source_path, compiled first when missing or older than the source """
+    if not is_up_to_date(source_path, language, compiled_dir):
+        compile_corpus(source_path, encoding, language, compiled_dir)
+    blob_path, index_path, _ = compiled_paths(language, compiled_dir)
+    meta = _read_meta(language, compiled_dir)
+    return CompiledCorpus(blob_path, index_path, version=meta["sha256"])
+
+
+
+def parse_args():
+    parser = ArgumentParser(description="Compile the data/<language>.txt corpora for memory-mapped access")
+    parser.add_argument("languages", nargs="*", help="Languages to compile, all of data/ by default")
+    parser.add_argument("--force", action="store_true", help="Compile even when up to date")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from app.get_text import ENCODINGS, get_available_languages
+    args = parse_args()
+    for language in args.languages or get_available_languages():
+        source_path = f"data/{language}.txt"
+        if args.force or not is_up_to_date(source_path, language):
+            compile_corpus(source_path, ENCODINGS[language], language)
+            print("Compiled", language)
@@ -3,6 +3,8 @@ import glob
 from pathlib import Path
 import random
 from tarfile import ENCODING
+from app.paragraph_sampler import ParagraphSampler
+from app.corpus import open_corpus
 
 
 def get_available_languages() -> list:
@@ -25,30 +27,37 @@ ENCODINGS = {
 
 
 class TextProvider():
-    def __init__(self, language:str, num_sentences:int) -> None:
+    def __init__(self, language:str, num_sentences:int, seed=None, usage=None, counts=None) -> None:
         self.language = language
         self.max_words = 40
         self.get_sentences()
         self.num_sentences = num_sentences
+        # kept so that the exact texts read by a participant can be drawn again
+        self.seed = seed if seed is not None else random.SystemRandom().randrange(2**32)
+        # usage: SentenceUsage shared by the stations, the least-read sentences are offered first;
+        # counts: the usage counts a resumed session started with, instead of the current ones
+        if counts is None and usage is not None:
+            counts = usage.counts(self.language, self.sentences.version, len(self.sentences))
+        self.counts = counts
+        self.sampler = ParagraphSampler(self.sentences, self.max_words, seed=self.seed,
+                                        word_counts=self.sentences.word_counts, usage=counts)
 
 
     def get_sentences(self):
-        self.sentences = []
-        in_file = open(f"data/{self.language}.txt", "r", encoding=ENCODINGS[self.language])
-        for line in in_file:
-            self.sentences.append(line)
-        in_file.close()
-
-
-    def get_paragraph(self):
-        start_idx = random.randint(0, len(self.sentences) - (self.num_sentences + 1))
-        num_words = 0
-        out_text = ""
-        while num_words < self.max_words or start_idx >= len(self.sentences):
-            sentence = self.sentences[start_idx]
-            if len(sentence.split()) + num_words > self.max_words:
-                sentence = " ".join(sentence.split()[:self.max_words - num_words])
-            del self.sentences[start_idx]
-            out_text += sentence 
-            num_words += len(sentence.split())
-        return out_text
\ No newline at end of file
+        # memory-mapped compiled corpus, compiled on first use (see app/corpus.py)
+        self.sentences = open_corpus(f"data/{self.language}.txt", ENCODINGS[self.language], self.language)
+
+
+    def get_paragraph(self) -> str:
+        return self.sampler.get_paragraph()
+
+
+    def skip(self, num_paragraphs:int):
+        """ draws and drops the paragraphs already recorded in a resumed session """
+        for _ in range(num_paragraphs):
+            self.sampler.get_paragraph()
+
+
+    def get_last_sentence_ids(self) -> list:
+        """ ids of the sentences of the last paragraph, for SentenceUsage.record """
+        return list(self.sampler.last_ids)
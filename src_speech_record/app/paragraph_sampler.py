@@ -0,0 +1,95 @@
+import random
+from array import array
+
+import numpy as np
+
+
+
+class ParagraphSampler():
+    """ Draws paragraphs of consecutive unused sentences from a corpus without modifying it.
+
+    Word counts are computed once per sentence, or taken from a compiled corpus. Used
+    sentences are flagged in `used` and skipped through a "next unused sentence" forest
+    (union-find with path halving), so a paragraph costs time proportional to its own
+    length, whatever the corpus size.
+    With `usage` (times each sentence was read in earlier sessions), only the least-used
+    sentences are offered; the next level is opened when they are all used.
+    With the same seed, the same corpus and usage yield the same paragraphs.
+    """
+    def __init__(self, sentences, max_words:int, seed=None, word_counts=None, usage=None) -> None:
+        self.sentences = sentences
+        self.max_words = max_words
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.word_counts = word_counts if word_counts is not None else [len(sentence.split()) for sentence in sentences]
+        # 1: used in this session, 2: deferred, read more often than the current level
+        self.used = bytearray(len(sentences))
+        # _next[i] leads to the first unused sentence >= i, len(sentences) when there is none
+        self._next = array("q", range(len(sentences) + 1))
+        self.num_used = 0
+        self.num_deferred = 0
+        self.usage = usage
+        self.last_ids = []
+        if self.usage is not None:
+            self._open_level()
+
+
+    def _open_level(self):
+        """ defers every sentence not used in this session that was read more often than the least-read one """
+        used = np.frombuffer(self.used, dtype=np.uint8)
+        used[used == 2] = 0
+        available = used == 0
+        if not available.any():
+            return
+        used[available & (self.usage > self.usage[available].min())] = 2
+        self.num_deferred = int(np.count_nonzero(used == 2))
+        num_sentences = len(self.sentences)
+        first_free = np.where(used == 0, np.arange(num_sentences), num_sentences)
+        first_free = np.minimum.accumulate(first_free[::-1])[::-1]
+        self._next = array("q", first_free.tolist() + [num_sentences])
+
+
+    def _find(self, idx:int) -> int:
+        while self._next[idx] != idx:
+            self._next[idx] = self._next[self._next[idx]]
+            idx = self._next[idx]
+        return idx
+
+
+    def mark_used(self, idx:int):
+        if not self.used[idx]:
+            self.used[idx] = 1
+            self._next[idx] = idx + 1
+            self.num_used += 1
+
+
+    def _pick_start(self) -> int:
+        start = self._find(self.rng.randrange(len(self.sentences)))
+        if start == len(self.sentences):
+            start = self._find(0)
+        return start
+
+
+    def get_paragraph(self) -> str:
+        """ up to max_words words of consecutive unused sentences from a random position, the last
+        sentence is truncated to fit. The ids of the sentences used are left in last_ids. """
+        if self.num_used + self.num_deferred >= len(self.sentences) and self.num_deferred > 0:
+            self._open_level()
+        if self.num_used >= len(self.sentences):
+            raise ValueError("All sentences of the corpus have been used")
+        idx = self._pick_start()
+        num_words = 0
+        out_text = ""
+        self.last_ids = []
+        while num_words < self.max_words and idx < len(self.sentences):
+            sentence = self.sentences[idx]
+            count = int(self.word_counts[idx])
+            if count + num_words > self.max_words:
+                sentence = " ".join(sentence.split()[:self.max_words - num_words])
+                count = self.max_words - num_words
+            self.mark_used(idx)
+            self.last_ids.append(idx)
+            out_text += sentence
+            num_words += count
+            idx = self._find(idx)
+        return out_text
@@ -1,10 +1,13 @@
-import pandas as pd
+import json
 import os 
 import pyaudio 
-import wave
 import numpy as np
-from scipy.io import wavfile
 from app.get_text import ENCODINGS
+from audio_common.demux import ChannelDemuxer
+from audio_common.wav_writer import StreamingWavWriter
+from audio_common.devices import DeviceCatalog
+from audio_common.participants import ParticipantRegistry
+from app.sentence_usage import SentenceUsage
 
 
 
@@ -17,41 +20,91 @@ DEVICE_NAME = "Microphone Array (Realtek Audio"
 CHANNELS = 2
 """
 
-
-def explore_devices(name):
-  # establish index of input device for sound card
-  pa = pyaudio.PyAudio()
-  for id in range(pa.get_device_count()):
-      dev_dict = pa.get_device_info_by_index(id)
-      if dev_dict["name"] == name:
-        print("Found: ", dev_dict)
-        return dev_dict
+DEVICE_PROFILE_PATH = "recordings/device_profile.json"
+PARTICIPANTS_DB_PATH = "recordings/participants.sqlite"
+PARTICIPANTS_CSV_PATH = "recordings/participants.csv"
+PARTICIPANT_FIELDS = ["first_name", "last_name", "gender", "language"]
+SENTENCE_USAGE_PATH = "recordings/sentence_usage.sqlite"
+# in the participant directory: seed of the text sampler and number of completed recordings
+SESSION_STATE_FILE = "session.json"
+# in the participant directory: sentence usage counts the text sampler started with
+SAMPLER_COUNTS_FILE = "sampler_counts.npy"
 
 
 
 class Recorder():
-    def __init__(self, device_name=DEVICE_NAME) -> None:
-        self.df = pd.read_csv("recordings/participants.csv")
-        self.participant_info = {"participant_id": len(self.df), "first_name": None, 
+    def __init__(self, device_name=DEVICE_NAME, streaming=True) -> None:
+        self.registry = ParticipantRegistry(PARTICIPANTS_DB_PATH, PARTICIPANTS_CSV_PATH, PARTICIPANT_FIELDS)
+        self.usage = SentenceUsage(SENTENCE_USAGE_PATH)
+        # the id is allocated when the participant is registered, in set_language
+        self.participant_info = {"participant_id": None, "first_name": None, 
                                 "last_name": None, "gender": None, "language": None}
 
-        self.save_dir = f"recordings/participant_{self.participant_info['participant_id']}"
+        self.save_dir = None
         self.current_recording = 0
         self.rate = 44100
         self.channels = CHANNELS
         self.device_name = device_name
-        dev_dict = explore_devices(name=self.device_name)
+        self.format = pyaudio.paInt16
+        self.catalog = DeviceCatalog.shared(DEVICE_PROFILE_PATH)
+        self.pa = self.catalog.pa
+        dev_dict = self.catalog.find(self.device_name)
         if dev_dict is None:
             raise ValueError(f"Device with name: {self.device_name} not found.")
         self.device_idx = dev_dict["index"]
+        if not self.catalog.supports(dev_dict, rate=self.rate, channels=self.channels, fmt=self.format):
+            raise ValueError(f"Device {self.device_name} does not support {self.channels} channels at {self.rate} Hz")
+        # streaming: captured buffers are written to disk while recording instead of kept in memory
+        self.streaming = streaming
+        self.writer = None
+        # what is needed to draw the texts of the session again, see save_sampler_state()
+        self.session_state = None
 
 
     def set_language(self, language:str):
         self.participant_info["language"] = language 
         self.check_info()
-        self.df = self.df.append(self.participant_info, ignore_index=True)
-        self.df.to_csv("recordings/participants.csv", index=False)
-        os.mkdir(f"recordings/participant_{self.participant_info['participant_id']}")
+        self.participant_info["participant_id"] = self.registry.register(self.participant_info)
+        self.save_dir = f"recordings/participant_{self.participant_info['participant_id']}"
+        os.mkdir(self.save_dir)
+
+
+    def resume(self, participant_id:int):
+        """ continues the session of a registered participant after its last completed recording,
+        instead of set_info_participant and set_language """
+        self.save_dir = f"recordings/participant_{participant_id}"
+        with open(os.path.join(self.save_dir, SESSION_STATE_FILE), "r", encoding="utf-8") as in_file:
+            self.session_state = json.load(in_file)
+        self.participant_info["participant_id"] = participant_id
+        self.participant_info["language"] = self.session_state["language"]
+        self.current_recording = self.session_state["completed"]
+
+
+    def save_sampler_state(self, seed:int, corpus_version:str, counts=None):
+        """ stores the seed and usage counts of the text sampler, so that a resumed session
+        draws the same paragraphs """
+        if counts is not None:
+            np.save(os.path.join(self.save_dir, SAMPLER_COUNTS_FILE), counts)
+        self.session_state = {"language": self.participant_info["language"], "seed": seed,
+                              "corpus_version": corpus_version, "completed": self.current_recording}
+        self._write_session_state()
+
+
+    def load_sampler_state(self):
+        """ seed, corpus version and usage counts saved by save_sampler_state, None for a new session """
+        if self.session_state is None:
+            return None
+        counts_path = os.path.join(self.save_dir, SAMPLER_COUNTS_FILE)
+        counts = np.load(counts_path) if os.path.isfile(counts_path) else None
+        return {"seed": self.session_state["seed"], "corpus_version": self.session_state["corpus_version"],
+                "counts": counts}
+
+
+    def _write_session_state(self):
+        path = os.path.join(self.save_dir, SESSION_STATE_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as out_file:
+            json.dump(self.session_state, out_file)
+        os.replace(path + ".tmp", path)
 
 
     def set_info_participant(self, info:dict):
@@ -66,21 +119,23 @@ class Recorder():
 
 
     def callback(self, in_data, frame_count, time_info, flag):
-        self.fulldata.append(in_data) #saves filtered data in an array
+        if self.writer is not None:
+            self.writer.write(in_data)
+        else:
+            self.fulldata.append(in_data) #saves filtered data in an array
         return (in_data, pyaudio.paContinue)
 
 
-    def start_recording(self, text_to_read:str):
+    def start_recording(self, text_to_read:str, sentence_ids=None, corpus_version=None):
         self.current_recording += 1
-        self.save_text(text_to_read)
-        self.pa = pyaudio.PyAudio()
-        self.format = pyaudio.paInt16
+        self.save_text(text_to_read, sentence_ids, corpus_version)
         self.fulldata = []
 
-        self.pa.is_format_supported(rate=self.rate,
-                            input_device=self.device_idx,
-                            input_channels=self.channels,
-                            input_format=self.format)
+        if self.streaming:
+            self.writer = StreamingWavWriter(self.get_all_channels_path(), channels=self.channels,
+                                             sampwidth=self.pa.get_sample_size(self.format), rate=self.rate,
+                                             channel_paths=self.get_channel_paths())
+            self.writer.start()
 
         self.stream_in = self.pa.open(
             rate=self.rate,
@@ -94,33 +149,48 @@ class Recorder():
         self.stream_in.start_stream()
 
 
-    def save_text(self, text_to_read:str):
+    def save_text(self, text_to_read:str, sentence_ids=None, corpus_version=None):
         output_path = os.path.join(self.save_dir, f"{self.current_recording}.txt")
         out_file = open(output_path, "w", encoding=ENCODINGS[self.participant_info["language"]])
         out_file.write(text_to_read)
         out_file.close()
+        if sentence_ids is not None:
+            # counted once the text is on disk, in one transaction
+            self.usage.record(self.participant_info["language"], corpus_version, sentence_ids)
         
 
     def stop_recording(self):
         self.stream_in.stop_stream()
         self.stream_in.close()
         self.save_recording()
+        if self.session_state is not None:
+            self.session_state["completed"] = self.current_recording
+            self._write_session_state()
+
+
+    def get_all_channels_path(self) -> str:
+        return os.path.join(self.save_dir, f"{self.current_recording}_all_channels.wav")
+
+
+    def get_channel_paths(self) -> dict:
+        """ channel index -> output path of the per-channel files """
+        return {
+            0: os.path.join(self.save_dir, f"{self.current_recording}_air_demo.wav"),
+            1: os.path.join(self.save_dir, f"{self.current_recording}_bone_demo.wav"),
+            2: os.path.join(self.save_dir, f"{self.current_recording}_air_reference.wav"),
+        }
 
 
     def save_recording(self):
-        output_path = os.path.join(self.save_dir, f"{self.current_recording}_all_channels.wav")
-        wav_file = wave.open(output_path, "wb")
-        wav_file.setnchannels(self.channels)        # number of channels
-        wav_file.setsampwidth(self.pa.get_sample_size(self.format))        # sample width in bytes
-        wav_file.setframerate(self.rate) 
-        wav_file.writeframes(b''.join(self.fulldata))
-        wav_file.close()
-
-        rate, all_channels = wavfile.read(output_path)
-
-        air_demo_path = os.path.join(self.save_dir, f"{self.current_recording}_air_demo.wav")
-        wavfile.write(air_demo_path, rate=rate, data=all_channels[:,0])
-        bone_demo_path = os.path.join(self.save_dir, f"{self.current_recording}_bone_demo.wav")
-        wavfile.write(bone_demo_path, rate=rate, data=all_channels[:,1])
-        air_reference_path = os.path.join(self.save_dir, f"{self.current_recording}_air_reference.wav")
-        wavfile.write(air_reference_path, rate=rate, data=all_channels[:,2])
+        if self.writer is not None:
+            self.writer.close()
+            stats = self.writer.stats()
+            if stats["dropped_buffers"] > 0:
+                print("Writer could not keep up, dropped buffers:", stats)
+            self.writer = None
+        else:
+            demuxer = ChannelDemuxer(self.get_all_channels_path(), self.get_channel_paths(), channels=self.channels,
+                                     sampwidth=self.pa.get_sample_size(self.format), rate=self.rate)
+            demuxer.open()
+            demuxer.write(b''.join(self.fulldata))
+            demuxer.close()
@@ -0,0 +1,66 @@
+import sqlite3
+
+import numpy as np
+
+
+
+class SentenceUsage():
+    """ Number of times every sentence of a corpus has been read, across participants.
+
+    Shared by every recording station through SQLite: record() increments the sentences of
+    a saved text in a single transaction. Rows only exist for sentences read at least once,
+    counts() expands them to a compact array indexed by sentence id. The counts of a
+    language are reset when its compiled corpus changes, as sentence ids change with it.
+    """
+    def __init__(self, db_path:str) -> None:
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS corpora (language TEXT PRIMARY KEY, version TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS usage (
+                language TEXT NOT NULL, sentence_id INTEGER NOT NULL, count INTEGER NOT NULL,
+                PRIMARY KEY (language, sentence_id));
+        """)
+
+
+    def _check_version(self, language:str, version:str):
+        row = self.connection.execute("SELECT version FROM corpora WHERE language = ?", (language,)).fetchone()
+        if row is None or row[0] != version:
+            self.connection.execute("DELETE FROM usage WHERE language = ?", (language,))
+            self.connection.execute("INSERT OR REPLACE INTO corpora (language, version) VALUES (?, ?)", (language, version))
+
+
+    def counts(self, language:str, version:str, num_sentences:int) -> np.ndarray:
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._check_version(language, version)
+            rows = self.connection.execute("SELECT sentence_id, count FROM usage WHERE language = ?",
+                                           (language,)).fetchall()
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        counts = np.zeros(num_sentences, dtype=np.uint32)
+        if rows:
+            rows = np.array(rows, dtype=np.int64)
+            rows = rows[rows[:, 0] < num_sentences]
+            counts[rows[:, 0]] = rows[:, 1]
+        return counts
+
+
+    def record(self, language:str, version:str, sentence_ids:list):
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._check_version(language, version)
+            self.connection.executemany(
+                "INSERT INTO usage (language, sentence_id, count) VALUES (?, ?, 1) "
+                "ON CONFLICT (language, sentence_id) DO UPDATE SET count = count + 1",
+                [(language, int(sentence_id)) for sentence_id in sentence_ids])
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,80 @@
+""" Micro-benchmark of the capture callback path: list append of every PortAudio buffer
+(old Recorder.callback) against copying into the preallocated CaptureRing.
+
+Run from src_speech_record: python benchmark_capture.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+# audio_common is at the root of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_common.ring_buffer import CaptureRing
+
+
+
+FRAMES_PER_BUFFER = 1024
+CHANNELS = 4
+RATE = 44100
+NUM_CALLBACKS = 2000      # ~46 s of audio at 44.1 kHz
+
+
+def make_source():
+    rng = np.random.default_rng(0)
+    return rng.integers(-2**15, 2**15, size=(NUM_CALLBACKS, FRAMES_PER_BUFFER * CHANNELS), dtype="<i2")
+
+
+def list_append_callback(fulldata):
+    def callback(in_data):
+        fulldata.append(in_data)
+    return callback
+
+
+def ring_callback(ring):
+    def callback(in_data):
+        ring.write(in_data)
+        # a consumer keeps up in the real app, drain here so the ring never fills
+        ring.advance(ring.available())
+    return callback
+
+
+def run(name, make_callback, source):
+    # timing pass
+    callback = make_callback()
+    timings = np.empty(len(source))
+    for i, row in enumerate(source):
+        # PortAudio hands a fresh bytes object to every callback, create it outside the timed section
+        in_data = row.tobytes()
+        t0 = time.perf_counter_ns()
+        callback(in_data)
+        timings[i] = time.perf_counter_ns() - t0
+        del in_data
+
+    # allocation pass, tracemalloc slows everything down so it is kept out of the timings
+    callback = make_callback()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for row in source:
+        in_data = row.tobytes()
+        callback(in_data)
+        del in_data
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, "filename")
+    allocations = sum(max(stat.count_diff, 0) for stat in stats)
+    print(f"{name:12s} mean {timings.mean() / 1000:7.2f} us  p99 {np.percentile(timings, 99) / 1000:7.2f} us  "
+          f"max {timings.max() / 1000:8.2f} us  live allocations {allocations:6d}  traced peak {peak / 1e6:7.2f} MB")
+
+
+def main():
+    source = make_source()
+    print(f"{NUM_CALLBACKS} callbacks of {FRAMES_PER_BUFFER} frames x {CHANNELS} channels")
+    run("list append", lambda: list_append_callback([]), source)
+    run("CaptureRing", lambda: ring_callback(CaptureRing(capacity_frames=2**18, channels=CHANNELS)), source)
+
+
+if __name__ == "__main__":
+    main()
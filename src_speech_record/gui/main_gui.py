@@ -7,6 +7,7 @@ from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 import sys
 import time
+from argparse import ArgumentParser
 from gui.language_select import LanguageSelectWidget
 from gui.recording_window import RecordingWidget
 from app.record import Recorder
@@ -16,9 +17,10 @@ from gui.form import FormWindow
 class MainWindow(QMainWindow):
     #EXIT_CODE_REBOOT = -12345678 
 
-    def __init__(self) -> None:
+    def __init__(self, resume_id=None) -> None:
         super().__init__()
-        self.restart_recording()
+        self.main_widget = MainWidget(parent=self, resume_id=resume_id)
+        self.setCentralWidget(self.main_widget)
         self.setGeometry(100, 100, 800, 500)
 
     
@@ -31,10 +33,12 @@ class MainWindow(QMainWindow):
 
 class MainWidget(QWidget):
      
-    def __init__(self, parent):
+    def __init__(self, parent, resume_id=None):
         super().__init__(parent=parent)
         self.recorder = Recorder()
         self.UI()
+        if resume_id is not None:
+            self.resume_recording(resume_id)
         
 
     def UI(self):
@@ -74,6 +78,14 @@ class MainWidget(QWidget):
         self.layout().addWidget(self.recording_window)
 
 
+    def resume_recording(self, participant_id):
+        self.form_window.hide()
+        self.recorder.resume(participant_id)
+        language = self.recorder.participant_info["language"]
+        self.recording_window = RecordingWidget(parent=self, language=language)
+        self.layout().addWidget(self.recording_window)
+
+
     def recording_finished(self):
         print("Finished all recordings")
         self.recording_window.destroy()
@@ -86,11 +98,15 @@ class MainWidget(QWidget):
 
 
 def main():
+    parser = ArgumentParser()
+    parser.add_argument("--resume", type=int, default=None, metavar="PARTICIPANT_ID",
+                        help="continue the interrupted session of a participant")
+    args, qt_args = parser.parse_known_args()
 
-    a = QApplication(sys.argv)
+    a = QApplication(sys.argv[:1] + qt_args)
     font = QFont("Arial", 26)
     a.setFont(font)
-    w = MainWindow()
+    w = MainWindow(resume_id=args.resume)
     w.showMaximized()
     currentExitCode = a.exec_()
 
@@ -29,8 +29,25 @@ class RecordingWidget(QWidget):
         self.text_panel.setWordWrap(True)
 
         
-        self.text_provider = TextProvider(language, num_sentences=self.max_recordings)
+        self.text_provider = self._get_text_provider(parent.recorder)
         self.UI()
+
+
+    def _get_text_provider(self, recorder) -> TextProvider:
+        state = recorder.load_sampler_state()
+        if state is not None:
+            # resumed session: same seed and counts, the texts already recorded are drawn and dropped
+            text_provider = TextProvider(self.language, num_sentences=self.max_recordings, seed=state["seed"],
+                                         counts=state["counts"])
+            if text_provider.sentences.version == state["corpus_version"]:
+                text_provider.skip(recorder.current_recording)
+                self.num_recordings = recorder.current_recording
+                return text_provider
+            print("Corpus changed since the session started, drawing new texts")
+            self.num_recordings = recorder.current_recording
+        text_provider = TextProvider(self.language, num_sentences=self.max_recordings, usage=recorder.usage)
+        recorder.save_sampler_state(text_provider.seed, text_provider.sentences.version, text_provider.counts)
+        return text_provider
         
 
     def UI(self):
@@ -55,7 +72,8 @@ class RecordingWidget(QWidget):
         self.text_panel.setText(text_to_read)
         self.text_panel.show()
 
-        self.parent().recorder.start_recording(text_to_read)
+        self.parent().recorder.start_recording(text_to_read, sentence_ids=self.text_provider.get_last_sentence_ids(),
+                                               corpus_version=self.text_provider.sentences.version)
 
 
 
@@ -1,31 +1,30 @@
+import os
+import sys
 import pyaudio 
 import wave
+# audio_common is at the root of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_common.devices import DeviceCatalog
+
+
+DEVICE_PROFILE_PATH = "recordings/device_profile.json"
 
 
 
 def print_all_devices():
-  pa = pyaudio.PyAudio()
-  for id in range(pa.get_device_count()):
-    dev_dict = pa.get_device_info_by_index(id)
-    for key, value in dev_dict.items():
-        print(key, value)
+  DeviceCatalog.shared(DEVICE_PROFILE_PATH).print_all_devices()
 
 
 
 def explore_devices(name):
   # establish index of input device for sound card
-  pa = pyaudio.PyAudio()
-  print(pa.get_default_host_api_info())
-
-  for id in range(pa.get_device_count()):
-      dev_dict = pa.get_device_info_by_index(id)
-      if dev_dict["name"] == name:
-        print("Found: ", dev_dict)
-        return dev_dict
+  catalog = DeviceCatalog.shared(DEVICE_PROFILE_PATH)
+  print(catalog.pa.get_default_host_api_info())
+  return catalog.find(name)
 
 
 def record(device_index:int, output_filename:str, length_record=5, rate=44100, channels=2):
-    pa = pyaudio.PyAudio()
+    pa = DeviceCatalog.shared(DEVICE_PROFILE_PATH).pa
     format = pyaudio.paInt16
 
 
@@ -0,0 +1,63 @@
+"""Benchmark of the syllable track synthesis: the original concatenate-in-the-loop routine
+against the planned, preallocated synthesize_syl_audio.
+
+Syllables are random arrays of typical lengths, so that no dataset is needed.
+Run from xpGUI: python benchmark_synthesis.py
+"""
+import random
+import time
+import numpy as np
+
+from synthesis import _min_max_scaling, synthesize_syl_audio
+
+
+FS = 16000
+NUM_SYLLABLES = 500
+REPEATS = 20
+
+
+def make_syllables():
+    rng = np.random.default_rng(0)
+    # 0.15 to 0.5 s per syllable once trimmed
+    return [_min_max_scaling(rng.standard_normal(int(rng.integers(FS * 0.15, FS * 0.5))).astype(np.float32))
+            for _ in range(NUM_SYLLABLES)]
+
+def original_routine(syllables, fs, max_audio_duration):
+    """_generate_syl_audio before the synthesis engine, loading replaced by indexing."""
+    n_syls = 0
+    max_interval_length = np.random.uniform(3, 6)
+    duration = 0
+    init_padding_length = random.randint(0, fs)
+    audio = [np.random.normal(0, 1, init_padding_length)]
+    while duration < max_audio_duration:
+        audio.append(random.choice(syllables))
+        padding_length = random.randint(fs // 2, int(max_interval_length * fs))
+        audio.append(_min_max_scaling(np.random.normal(0, 1, padding_length), a=-1, b=1))
+        duration = len(np.concatenate(audio, axis=0)) / fs
+        n_syls += 1
+    return np.concatenate(audio, axis=0), n_syls
+
+def run(name, generate):
+    timings = np.empty(REPEATS)
+    for i in range(REPEATS):
+        t0 = time.perf_counter()
+        generate()
+        timings[i] = time.perf_counter() - t0
+    print(f'{name:22s} mean {timings.mean() * 1000:8.2f} ms  max {timings.max() * 1000:8.2f} ms')
+
+def main():
+    syllables = make_syllables()
+    for max_audio_duration in (10, 60, 300):
+        print(f'Tracks of {max_audio_duration} s at {FS} Hz')
+        run('original', lambda: original_routine(syllables, FS, max_audio_duration))
+        rng = np.random.default_rng(0)
+        run('synthesize_syl_audio', lambda: synthesize_syl_audio(syllables, FS, max_audio_duration, rng))
+
+    # same seed, same track
+    first, first_onsets = synthesize_syl_audio(syllables, FS, 60, np.random.default_rng(1234))
+    second, second_onsets = synthesize_syl_audio(syllables, FS, 60, np.random.default_rng(1234))
+    assert first.tobytes() == second.tobytes() and np.array_equal(first_onsets, second_onsets)
+    print('Bit-identical output for a given seed: OK')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Blocking work of the trials (disk writes, PortAudio stream setup), off the Tk main thread."""
+import queue
+import threading
+import traceback
+
+
+class DiskWorker():
+    """Runs the file writes of the trials, and the opening and closing of their streams, in order
+    on a worker thread.
+
+    Tk widgets must only be touched from the main thread, so the worker never calls back
+    itself: finished jobs are put in `done` and poll() runs their on_done callback (with
+    the result, or the exception raised by the job) when called from the Tk main loop.
+    """
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.done = queue.Queue()
+        self.pending = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, fn, *args, on_done=None):
+        """Queue fn(*args), on_done(result, error) is called by poll() once it ran."""
+        self.pending += 1
+        self.jobs.put((fn, args, on_done))
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            fn, args, on_done = job
+            try:
+                self.done.put((on_done, fn(*args), None))
+            except Exception as error:
+                traceback.print_exc()
+                self.done.put((on_done, None, error))
+
+    def poll(self):
+        """Run the callbacks of the finished jobs, from the Tk main loop."""
+        while True:
+            try:
+                on_done, result, error = self.done.get_nowait()
+            except queue.Empty:
+                return
+            self.pending -= 1
+            if on_done is not None:
+                on_done(result, error)
+
+    def stop(self):
+        """Wait for the queued jobs and stop the worker."""
+        self.jobs.put(None)
+        self.thread.join()
+        self.poll()
@@ -1,29 +1,31 @@
 """Fourth version of GUI."""
-import librosa
 import numpy as np
-import pickle
 import pyaudio
+import queue
 import random
 import re
-import soundfile as sf
-import threading
 import time
 import tkinter as tk
 import warnings
-import wave
-import winsound
 
 from argparse import ArgumentParser
 from collections import deque
 from datetime import datetime
-from glob import glob
 from operator import itemgetter
 # from playsound import playsound
 from scipy import signal
 from sklearn.preprocessing import MinMaxScaler
 from tkinter import ttk
 
-from utils import _find_records, _init_results_folder, _init_root, _input_language, _min_max_scaling, _vad_merge
+from disk_worker import DiskWorker
+from latency_probe import LatencyProbe
+from sentence_texts import SentenceTextStore
+from session_log import SessionLog, session_log_path
+from syllable_bank import SyllableBank
+from stimulus_player import StimulusPlayer
+from trial_audio import TrialAudioGenerator
+from trial_recorder import TrialRecorder
+from utils import _find_records, _init_results_folder, _init_root, _input_language
 
 
 def parse_args():
@@ -60,6 +62,18 @@ def parse_args():
         help='If data should be shuffled or not prior to the experiment'
     )
 
+    parser.add_argument(
+        '-seed', '--seed',
+        type=int, default=None,
+        help='Seed of the syllable audio generation'
+    )
+
+    parser.add_argument(
+        '--measure_latency',
+        default=False, action='store_true',
+        help='Measure the UI input latency during the trials'
+    )
+
     return parser.parse_args()
 
 class App():
@@ -76,6 +90,8 @@ class App():
         fs=16000,
         channels=2,
         chunk=1024,
+        seed=None,
+        measure_latency=False,
     ):
         """
         Main application: inducing cognitive load by a listening-reading dual task.
@@ -109,12 +125,30 @@ class App():
 
         chunk: int, default=1024
             Duration of a chunk, in ms
+
+        seed: int, default=None
+            Seed of the syllable audio generation, the same seed gives the same audio
+
+        measure_latency: bool, default=False
+            If True, reports how long UI input waited for the Tk main loop during every trial
         """
         self.root = root
         self.root.bind("<space>", self.run_trial)
 
         self.user_idx = user_idx
 
+        # Trial state: 'waiting_audio' -> 'ready' -> 'trial' -> 'waiting_audio'...
+        # every step returns to the Tk main loop, slow work (audio generation, opening and
+        # closing the streams, disk writes) runs on worker threads
+        self.state = 'waiting_audio'
+        self.disk = DiskWorker()
+        # one append per trial and per report, replaces the pickles rewritten after every trial
+        self.session_log = SessionLog(session_log_path(self.user_idx))
+        self.root.after(20, self._poll_disk)
+        self.latency_probe = LatencyProbe(self.root) if measure_latency else None
+        if self.latency_probe is not None:
+            self.latency_probe.start()
+
         tk.messagebox.showinfo(
             title='Description',
             message='\n'.join([
@@ -128,7 +162,7 @@ class App():
         )
 
         # Buttons
-        self.exit_button = tk.Button(self.root, text='Exit', command=self.root.destroy)
+        self.exit_button = tk.Button(self.root, text='Exit', command=self.exit)
         self.minimize_button = tk.Button(root, text='Mimimize', command=lambda: self.root.wm_state("iconic"))
         self.start_button = tk.Button(self.root, text='Record [SPACEBAR]', command=self.run_trial)
 
@@ -140,6 +174,9 @@ class App():
         self.language_idx = language_idx
         self.shuffle = shuffle
         self.sentence_data = self.load_data()
+        # prompt files decoded once, the upcoming ones in the background
+        self.sentence_texts = SentenceTextStore()
+        self.sentence_texts.preload(self.sentence_data)
         self.metadata = {}
         self.sentence_text = tk.StringVar()
         self.sentence_text.set(self.log_sentence_info())
@@ -162,8 +199,18 @@ class App():
         self.channels = channels
         self.chunk = chunk
         self.is_recording = False
-        self.frames = []
         self.sample_format = pyaudio.paInt16
+        self.p = pyaudio.PyAudio()
+        # the stimulus is played from memory, its start and end are located in the recording
+        self.player = StimulusPlayer(self.p, fs, chunk=chunk)
+        # the capture ring is sized from the stimulus of every trial
+        self.recorder = TrialRecorder(self._open_input_stream, self.player, fs, channels,
+                                      self.p.get_sample_size(self.sample_format), self.disk)
+        self.stimulus = None
+        self.stimulus_start_sample = None
+        self.stimulus_end_sample = None
+        # False when the recording of the trial could not be written (e.g. refused after an overrun)
+        self.recording_saved = None
 
         # Progress bar
         self.style = ttk.Style(self.root)
@@ -184,9 +231,17 @@ class App():
             variable=self.variable)
         self.progress_bar.pack(pady=100)
 
-        # Load random syllables
+        # Load random syllables, preprocessed once (see syllable_bank.py)
         self.max_audio_duration = max_audio_duration
-        self.n_syls = self._generate_syl_audio()
+        self.syllables = SyllableBank.load(self.fs)
+        self.rng = np.random.default_rng(seed)
+        # the audio of trial N+1 is generated while trial N is recorded
+        self.generator = TrialAudioGenerator(self.syllables, self.fs, self.max_audio_duration, self.rng)
+        self.n_syls = 0
+        self.syl_onsets = None
+        self.start_button['state'] = tk.DISABLED
+        self.generator.request(awgn_only=True)
+        self._wait_for_audio()
 
     def load_data(self, nb_sentences=3):
         text_fnames = _find_records(language='EN' if self.language_idx == 0 else 'FR')
@@ -201,97 +256,117 @@ class App():
             'sentence': self.sentence_nb,
             'text': self.log_sentence_info(),
             'fname': self.sentence_data[0],
-            'syls': self.n_syls
+            'syls': self.n_syls,
+            'syl_onsets': self.syl_onsets.tolist(),
+            'stimulus_start_sample': self.stimulus_start_sample,
+            'stimulus_end_sample': self.stimulus_end_sample,
+            # record_time names the WAV file only when it was saved; the syllables were played
+            # either way, so they stay in the block total the subject reports
+            'saved': self.recording_saved
         }
         print(self.metadata[now])
-        with open(f'results/{self.user_idx}/metadata_{self.user_idx}.pkl', 'wb') as f:
-            pickle.dump(self.metadata, f, pickle.HIGHEST_PROTOCOL)
-
-    def _generate_syl_audio(self, padding_mode='awgn'):
-        """Generate an audio composed of random syllables played at random intervals."""
-        fnames = glob('articulation_index/data/syls/wb/s/*/*.sph')
-        n_syls = 0
-
-        max_interval_length = np.random.uniform(3, 6)
-
-        if self.block_nb == 0:
-            audio = [np.random.normal(0, 1, self.max_audio_duration * self.fs)]  # only AWGN to begin the trial, no syllables
-        else:
-            duration = 0
-            init_padding_length = random.randint(0, self.fs)
-            audio = [np.random.normal(0, 1, init_padding_length)]
-            while duration < self.max_audio_duration:
-                # Pick a random syllable
-                fname = random.choice(fnames)
-
-                # Load and resample to desired SR
-                arr, _ = librosa.load(fname, sr=self.fs)
-
-                # Remove silences
-                arr = _vad_merge(arr)
-
-                # Scale to [-1, 1]
-                arr = _min_max_scaling(arr, a=-1, b=1)
-
-                # Collect current sample
-                audio.append(arr)
-
-                # Add some WGN before the next syllable, scaled to [-1, 1]
-                padding_length = random.randint(self.fs // 2, int(max_interval_length * self.fs))
-                padding_interval = _min_max_scaling(np.random.normal(0, 1, padding_length), a=-1, b=1)
-                audio.append(padding_interval)
-
-                # Update counts on total audio duration and number of syllables
-                duration = len(np.concatenate(audio, axis=0)) / self.fs
-                n_syls += 1
-
-        sf.write('tmp.wav', np.concatenate(audio, axis=0), samplerate=self.fs)
-        return n_syls
+        self.append_log({'type': 'trial', 'record_time': now, **self.metadata[now]})
+
+    def append_log(self, record):
+        """Append a record to the session log, on the disk worker."""
+        self.disk.submit(self.session_log.append, record, on_done=self._on_saved)
+
+    def _poll_disk(self):
+        """Handle the finished disk writes, from the main loop."""
+        self.disk.poll()
+        self.root.after(20, self._poll_disk)
+
+    def _on_saved(self, result, error):
+        if error is not None:
+            tk.messagebox.showerror(title='Error', message=f'Could not save the trial: {error}')
+
+    def exit(self):
+        """Wait for the pending writes, then close the window."""
+        self.disk.stop()
+        self.session_log.close()
+        self.root.destroy()
+
+    def _request_next_audio(self):
+        """Start generating the audio of the next trial, in the background."""
+        next_block_nb = self.block_nb + 1 if self.sentence_nb + 1 >= self.max_sentences else self.block_nb
+        if next_block_nb < self.max_blocks:
+            # only AWGN in the first block, no syllables
+            self.generator.request(awgn_only=next_block_nb == 0)
+
+    def _wait_for_audio(self):
+        """Poll the generator from the main loop, enable the next trial once its audio is ready."""
+        try:
+            audio, self.syl_onsets = self.generator.results.get_nowait()
+        except queue.Empty:
+            self.root.after(20, self._wait_for_audio)
+            return
+        self.stimulus = audio
+        # n_syls counts the syllables of the whole block
+        self.n_syls += len(self.syl_onsets)
+        self.state = 'ready'
+        self.start_button['state'] = tk.NORMAL
 
     def run_trial(self, event=None):
+        if self.state != 'ready':
+            # the audio of the trial is not ready yet, or a trial is running
+            return
+        self.state = 'trial'
+        if self.latency_probe is not None:
+            self.latency_probe.reset()
         self.start_recording()
-        self.stop_recording()
-        self.update(self.record_time)
 
-    def start_recording(self):
-        """Start recording."""
-        self.p = pyaudio.PyAudio()
+    def _wait_for_playback(self):
+        """Poll the player from the main loop, end the trial once the stimulus has been played."""
+        if not self.recorder.is_done():
+            self.root.after(10, self._wait_for_playback)
+            return
+        self.stop_recording()
 
-        self.stream = self.p.open(
+    def _open_input_stream(self, stream_callback):
+        """Called by the recorder on the worker thread."""
+        return self.p.open(
             format=self.sample_format,
             channels=self.channels,
             rate=self.fs,
             frames_per_buffer=self.chunk,
-            input=True)
+            input=True,
+            start=False,
+            stream_callback=stream_callback)
 
+    def start_recording(self):
+        """Start recording, then the stimulus playback, on the worker. Returns immediately."""
         self.is_recording = True
         self.start_button['state'] = tk.DISABLED
         # self.stop_button['state'] = tk.NORMAL
-
+        self.recorder.start(self.stimulus, on_started=self._on_recording_started)
+
+    def _on_recording_started(self, result, error):
+        if error is not None:
+            self.is_recording = False
+            tk.messagebox.showerror(title='Error', message=f'Could not start the recording: {error}')
+            self.state = 'ready'
+            self.start_button['state'] = tk.NORMAL
+            return
         print('Recording...')
-        t = threading.Thread(target=self.record)
-        t.start()
-
-        winsound.PlaySound('tmp.wav', winsound.SND_FILENAME)
+        self._request_next_audio()
+        self._wait_for_playback()
 
     def stop_recording(self):
-        """Stop recording."""
+        """Stop recording and write it, on the worker. Returns immediately."""
         self.is_recording = False
-        print('Stopped recording.')
         self.record_time = datetime.now().strftime("%m-%d-%Y-%H-%M-%S")
+        self.recorder.stop(f'results/{self.user_idx}/{self.record_time}.wav', on_stopped=self._on_recording_stopped)
 
-        wf = wave.open(f'results/{self.user_idx}/{self.record_time}.wav', 'wb')
-        wf.setnchannels(self.channels)
-        wf.setsampwidth(self.p.get_sample_size(self.sample_format))
-        wf.setframerate(self.fs)
-        wf.writeframes(b''.join(self.frames))
-        wf.close()
-
-    def record(self):
-        """Record audio."""
-        while self.is_recording:
-            data = self.stream.read(self.chunk)
-            self.frames.append(data)
+    def _on_recording_stopped(self, result, error):
+        print('Stopped recording.')
+        if error is not None:
+            self._on_saved(None, error)
+            result = {'stimulus_start_sample': None, 'stimulus_end_sample': None}
+        self.recording_saved = error is None
+        # samples of the recording at which the stimulus starts and ends
+        self.stimulus_start_sample = result['stimulus_start_sample']
+        self.stimulus_end_sample = result['stimulus_end_sample']
+        self.update(self.record_time)
 
     def log_block_info(self):
         """Log info on baseline blocks."""
@@ -299,11 +374,7 @@ class App():
 
     def log_sentence_info(self):
         """Log the current reading input."""
-        try:
-            return '\n'.join([open(sentence, 'rt', encoding='utf-8').read() for sentence in self.sentence_data[0]])
-        except UnicodeDecodeError:
-            warnings.warn('Error decoding using UTF-8. Using UTF-16', UnicodeWarning)
-            return '\n'.join([open(sentence, 'rt', encoding='utf-16').read() for sentence in self.sentence_data[0]])
+        return self.sentence_texts.get(self.sentence_data[0])
 
     def pause(self, count):
         """Launch a countdown for a break between blocks."""
@@ -321,9 +392,16 @@ class App():
     def reset(self):
         """Reset main values."""
         self.block_text.set(self.log_block_info())
-        self.frames = []
         self.sentence_data.popleft()
-        self.start_button['state'] = tk.NORMAL
+        if self.latency_probe is not None and self.latency_probe.samples:
+            stats = self.latency_probe.stats()
+            print(f'UI input latency during the trial: mean {stats["mean"]:.1f} ms, p99 {stats["p99"]:.1f} ms, '
+                  f'max {stats["max"]:.1f} ms')
+            if stats['max'] > 50:
+                warnings.warn(f'UI input latency above 50 ms during the trial ({stats["max"]:.1f} ms)')
+        # enabled again once the audio of the next trial is ready
+        self.state = 'waiting_audio'
+        self._wait_for_audio()
         # self.stop_button['state'] = tk.DISABLED
 
         self.sentence_text.set(self.log_sentence_info())
@@ -335,26 +413,26 @@ class App():
 
         if self.sentence_nb + 1 >= self.max_sentences:
             # Ask the user to report his syllable count
-            reportingWindow(self.root, self.user_idx, self.n_syls, self.block_nb)
+            reportingWindow(self.root, self.user_idx, self.n_syls, self.block_nb, self.append_log)
 
             if self.block_nb + 1 == self.max_blocks:
                 # End the experiment.
                 print('End of session.')
-                self.root.destroy()
+                self.generator.stop()
+                self.exit()
                 return
 
             # Initiate a break before next block.
             self.pause(self.rest_time)
             self.block_nb += 1
             self.sentence_nb = 0
-            self.n_syls = self._generate_syl_audio()
+            self.n_syls = 0
 
             self.block_text.set(self.log_block_info())
 
         else:
             # Go to next setnence
             self.sentence_nb += 1
-            self.n_syls += self._generate_syl_audio()
 
         # Update progress bar (code is very ugly)
         total_nb_trials = self.max_sentences * self.max_blocks
@@ -368,7 +446,7 @@ class App():
 
 class reportingWindow():
     """Reporting window to ask the user how many syllables he counted."""
-    def __init__(self, root, user_idx, n_syls, block_nb):
+    def __init__(self, root, user_idx, n_syls, block_nb, append_log):
         self.top = tk.Toplevel(root)
         self.top.attributes('-fullscreen', True)
         self.reporting_label = tk.Label(
@@ -416,6 +494,7 @@ class reportingWindow():
         self.user_idx = user_idx
         self.n_syls = n_syls
         self.block_nb = block_nb
+        self.append_log = append_log
 
     def quit(self):
         try:
@@ -431,10 +510,9 @@ class reportingWindow():
             # arousal = self.arousal_scale.get()
             # valence = self.valence_scale.get()
 
-            # Dump prediction results in a file
-            with open(f'results/{self.user_idx}/reporting_{self.user_idx}_block_{self.block_nb}.pkl', 'wb') as f:
-                # pickle.dump({'pred': pred, 'true': self.n_syls, 'arousal': arousal, 'valence': valence}, f, pickle.HIGHEST_PROTOCOL)
-                pickle.dump({'pred': pred, 'true': self.n_syls, 'arousal': None, 'valence': None}, f, pickle.HIGHEST_PROTOCOL)
+            # Log prediction results
+            # self.append_log({'type': 'report', 'block': self.block_nb, 'pred': pred, 'true': self.n_syls, 'arousal': arousal, 'valence': valence})
+            self.append_log({'type': 'report', 'block': self.block_nb, 'pred': pred, 'true': self.n_syls, 'arousal': None, 'valence': None})
 
             self.top.destroy()
         except ValueError:
@@ -461,5 +539,7 @@ if __name__ == '__main__':
         max_sentences=args.max_sentences,
         rest_time=args.rest_time,
         max_audio_duration=args.max_audio_duration,
-        shuffle=args.no_shuffle)
+        shuffle=args.no_shuffle,
+        seed=args.seed,
+        measure_latency=args.measure_latency)
     root.mainloop()
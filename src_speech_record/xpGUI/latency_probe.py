@@ -0,0 +1,43 @@
+"""Measure of the responsiveness of the Tk main loop."""
+import numpy as np
+import time
+
+
+class LatencyProbe():
+    """Schedules a callback every interval_ms with root.after and records how late it runs.
+
+    The lateness is the time an input event would wait before being handled, so it is the
+    UI input latency. stats() summarizes the samples since the last reset().
+    """
+    def __init__(self, root, interval_ms=5):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.samples = []
+        self.expected = None
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.expected = time.perf_counter() + self.interval_ms / 1000
+        self.root.after(self.interval_ms, self._tick)
+
+    def _tick(self):
+        if not self.running:
+            return
+        now = time.perf_counter()
+        self.samples.append(max(now - self.expected, 0))
+        self.expected = now + self.interval_ms / 1000
+        self.root.after(self.interval_ms, self._tick)
+
+    def stop(self):
+        self.running = False
+
+    def reset(self):
+        self.samples = []
+
+    def stats(self):
+        """Mean, 99th percentile and max lateness, in ms."""
+        if not self.samples:
+            return {'count': 0, 'mean': None, 'p99': None, 'max': None}
+        samples = np.array(self.samples) * 1000
+        return {'count': len(samples), 'mean': samples.mean(), 'p99': np.percentile(samples, 99), 'max': samples.max()}
@@ -0,0 +1,46 @@
+"""In-memory store of the SIWIS prompt texts."""
+import threading
+import warnings
+
+
+class SentenceTextStore():
+    """Decodes every prompt file once and serves the texts from memory.
+
+    A file is read as UTF-8, or as UTF-16 when it is not valid UTF-8; the text is then
+    kept, so neither the read nor the detection happen again. preload() decodes the
+    upcoming prompts on a background thread.
+    """
+    def __init__(self):
+        self.texts = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def _decode(self, fname):
+        with open(fname, 'rb') as f:
+            raw = f.read()
+        try:
+            text = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            warnings.warn(f'Error decoding {fname} using UTF-8. Using UTF-16', UnicodeWarning)
+            text = raw.decode('utf-16')
+        # universal newlines, as when the file is opened in text mode
+        return text.replace('\r\n', '\n').replace('\r', '\n')
+
+    def get_text(self, fname):
+        with self.lock:
+            text = self.texts.get(fname)
+        if text is None:
+            text = self._decode(fname)
+            with self.lock:
+                self.texts[fname] = text
+        return text
+
+    def get(self, fnames):
+        """Texts of a group of prompt files, one per line."""
+        return '\n'.join([self.get_text(fname) for fname in fnames])
+
+    def preload(self, groups):
+        """Decode the files of the groups, in order, on a background thread."""
+        fnames = [fname for group in groups for fname in group]
+        self.thread = threading.Thread(target=lambda: [self.get_text(fname) for fname in fnames], daemon=True)
+        self.thread.start()
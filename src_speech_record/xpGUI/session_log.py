@@ -0,0 +1,96 @@
+"""Append-only log of a session: trial metadata and block reports."""
+import json
+import os
+import pickle
+import threading
+import time
+
+from argparse import ArgumentParser
+
+
+def session_log_path(user_idx, results_dir='results'):
+    return os.path.join(results_dir, str(user_idx), f'session_{user_idx}.jsonl')
+
+class SessionLog():
+    """JSON Lines log of a session, one record per trial or report.
+
+    append() writes and flushes a single line, so its cost does not grow with the session and
+    a crash of the application loses nothing. fsync is batched: at most every fsync_every
+    records or fsync_interval seconds, and on close(). Thread-safe.
+    """
+    def __init__(self, path, fsync_every=10, fsync_interval=2.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.file = open(path, 'at', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def append(self, record):
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            self.unsynced += 1
+            if self.unsynced >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self._sync()
+            self.file.close()
+
+def load_session(path):
+    """Rebuild the dicts of the former pickles from a session log.
+
+    Returns:
+    --------
+    metadata: dict
+        record time -> trial metadata, as in metadata_{user_idx}.pkl
+    reports: dict
+        block nb -> {'pred', 'true', 'arousal', 'valence'}, as in reporting_{user_idx}_block_{block_nb}.pkl
+    """
+    metadata = {}
+    reports = {}
+    with open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break  # last line torn by a crash
+            kind = record.pop('type')
+            if kind == 'trial':
+                record['fname'] = tuple(record['fname'])
+                metadata[record.pop('record_time')] = record
+            elif kind == 'report':
+                reports[record.pop('block')] = record
+    return metadata, reports
+
+def export_pickles(user_idx, results_dir='results'):
+    """Write the former metadata and reporting pickles of a session, for the analysis scripts."""
+    metadata, reports = load_session(session_log_path(user_idx, results_dir))
+    with open(os.path.join(results_dir, str(user_idx), f'metadata_{user_idx}.pkl'), 'wb') as f:
+        pickle.dump(metadata, f, pickle.HIGHEST_PROTOCOL)
+    for block_nb, report in reports.items():
+        with open(os.path.join(results_dir, str(user_idx), f'reporting_{user_idx}_block_{block_nb}.pkl'), 'wb') as f:
+            pickle.dump(report, f, pickle.HIGHEST_PROTOCOL)
+
+def parse_args():
+    """Parse main arguments."""
+    parser = ArgumentParser(description='Export session logs to the former pickle files')
+    parser.add_argument('user_idx', type=int, nargs='+', help='Subject indices')
+    parser.add_argument('-results_dir', '--results_dir', default='results', help='Results folder')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    for user_idx in args.user_idx:
+        export_pickles(user_idx, args.results_dir)
@@ -0,0 +1,69 @@
+"""Non-blocking playback of the trial stimulus from memory."""
+import numpy as np
+import pyaudio
+import threading
+
+
+class StimulusPlayer():
+    """Plays a NumPy array through a PortAudio callback stream, on any OS, without a temp file.
+
+    start_time and end_time are the PortAudio stream times at which the first and the last
+    sample of the stimulus reach the DAC, in the clock of the input stream time_info, so the
+    stimulus can be placed in the concurrent microphone recording.
+    """
+    def __init__(self, p, fs, chunk=1024, output_device_index=None):
+        self.p = p
+        self.fs = fs
+        self.chunk = chunk
+        self.output_device_index = output_device_index
+        self.stream = None
+        self.samples = None
+        self.pos = 0
+        self.start_time = None
+        self.end_time = None
+        self.finished = threading.Event()
+
+    def play(self, audio):
+        """Start playing audio (float, mono, in [-1, 1]) and return immediately."""
+        # same clipping and scaling as a 16-bit WAV written by soundfile
+        self.samples = (np.clip(audio, -1, 1) * 32767).astype('<i2')
+        self.pos = 0
+        self.start_time = None
+        self.end_time = None
+        self.finished.clear()
+        self.stream = self.p.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.fs,
+            output=True,
+            output_device_index=self.output_device_index,
+            frames_per_buffer=self.chunk,
+            stream_callback=self._callback)
+        self.stream.start_stream()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        dac_time = time_info['output_buffer_dac_time'] or time_info['current_time'] + self.stream.get_output_latency()
+        if self.start_time is None:
+            self.start_time = dac_time
+        data = self.samples[self.pos:self.pos + frame_count]
+        self.pos += len(data)
+        if len(data) < frame_count:
+            # the stimulus ends in this buffer: its last sample reaches the DAC len(data) frames after dac_time
+            self.end_time = dac_time + len(data) / self.fs
+            self.finished.set()
+            return (data.tobytes(), pyaudio.paComplete)
+        return (data.tobytes(), pyaudio.paContinue)
+
+    def is_done(self):
+        """True once the last sample has been played."""
+        if not self.finished.is_set():
+            # the callback never reached the end of the stimulus, e.g. the output device went away:
+            # the trial must still end once the stream is no longer running
+            return self.stream is not None and not self.stream.is_active()
+        return self.stream.get_time() >= self.end_time
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
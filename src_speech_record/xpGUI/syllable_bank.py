@@ -0,0 +1,94 @@
+"""Preprocessed syllables of the Articulation index, stored once per sample rate."""
+import json
+import librosa
+import numpy as np
+import os
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+
+from synthesis import _min_max_scaling
+from utils import _vad_merge
+
+
+SYLLABLE_PATTERN = 'articulation_index/data/syls/wb/s/*/*.sph'
+BANK_DIR = 'articulation_index/bank'
+
+
+def _bank_paths(fs, top_db, bank_dir=BANK_DIR):
+    """Paths of the samples, offsets and file list of a bank."""
+    prefix = os.path.join(bank_dir, f'syls_{fs}_{top_db}')
+    return f'{prefix}_samples.npy', f'{prefix}_offsets.npy', f'{prefix}.json'
+
+def _preprocess_syllable(args):
+    """Load, resample, trim silences and scale a syllable to [-1, 1], as played in a trial."""
+    fname, fs, top_db = args
+    arr, _ = librosa.load(fname, sr=fs)
+    arr = _vad_merge(arr, top_db=top_db)
+    return _min_max_scaling(arr, a=-1, b=1).astype(np.float32)
+
+class SyllableBank():
+    """All the syllables, preprocessed, in a single memory-mapped array.
+
+    Syllable i is samples[offsets[i]:offsets[i + 1]]. The bank is keyed by sample rate and
+    VAD threshold, and built again when the syllable files change.
+    """
+    def __init__(self, samples_path, offsets_path, fnames):
+        self.samples = np.load(samples_path, mmap_mode='r')
+        self.offsets = np.load(offsets_path)
+        self.fnames = fnames
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        return self.samples[self.offsets[idx]:self.offsets[idx + 1]]
+
+    @classmethod
+    def build(cls, fs, top_db=20, pattern=SYLLABLE_PATTERN, bank_dir=BANK_DIR, workers=None):
+        """Preprocess every syllable in a process pool and write the bank."""
+        fnames = sorted(glob(pattern))
+        os.makedirs(bank_dir, exist_ok=True)
+        samples_path, offsets_path, meta_path = _bank_paths(fs, top_db, bank_dir)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            syllables = list(pool.map(_preprocess_syllable, [(fname, fs, top_db) for fname in fnames], chunksize=16))
+
+        offsets = np.zeros(len(syllables) + 1, dtype=np.int64)
+        np.cumsum([len(arr) for arr in syllables], out=offsets[1:])
+        samples = np.concatenate(syllables) if syllables else np.zeros(0, dtype=np.float32)
+        # np.save appends .npy to names without it, keep the temporary names ending with it
+        np.save(samples_path + '.tmp.npy', samples)
+        np.save(offsets_path + '.tmp.npy', offsets)
+        os.replace(samples_path + '.tmp.npy', samples_path)
+        os.replace(offsets_path + '.tmp.npy', offsets_path)
+        with open(meta_path + '.tmp', 'wt', encoding='utf-8') as f:
+            json.dump({'fs': fs, 'top_db': top_db, 'fnames': fnames}, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        print(f'Built syllable bank: {len(fnames)} syllables at {fs} Hz')
+        return cls(samples_path, offsets_path, fnames)
+
+    @classmethod
+    def load(cls, fs, top_db=20, pattern=SYLLABLE_PATTERN, bank_dir=BANK_DIR):
+        """Open the bank of fs and top_db, building it first if missing or out of date."""
+        samples_path, offsets_path, meta_path = _bank_paths(fs, top_db, bank_dir)
+        fnames = sorted(glob(pattern))
+        if os.path.isfile(meta_path):
+            with open(meta_path, 'rt', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta['fnames'] == fnames:
+                return cls(samples_path, offsets_path, fnames)
+        return cls.build(fs, top_db, pattern, bank_dir)
+
+def parse_args():
+    """Parse main arguments."""
+    parser = ArgumentParser(description='Build the preprocessed syllable bank')
+    parser.add_argument('-fs', '--fs', type=int, default=16000, help='Sample rate, in Hz')
+    parser.add_argument('-top_db', '--top_db', type=int, default=20, help='VAD threshold, in dB')
+    parser.add_argument('-workers', '--workers', type=int, default=None, help='Nb of worker processes')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    SyllableBank.build(args.fs, args.top_db, workers=args.workers)
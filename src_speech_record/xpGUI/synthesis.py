@@ -0,0 +1,78 @@
+"""Synthesis of the syllable tracks played during the trials."""
+import numpy as np
+
+
+def _min_max_scaling(x, a=-1, b=1):
+    """Scale data in [a, b]"""
+    return (b - a) * (x - np.min(x)) / np.ptp(x) + a
+
+def _plan_track(syllables, fs, max_audio_duration, rng):
+    """Draw the initial padding, the syllables and the gaps of a track, without building it.
+
+    Same rules as the original routine: syllables are added while the track is shorter than
+    max_audio_duration, each followed by a gap of 0.5 s to max_interval_length s.
+    """
+    max_interval_length = rng.uniform(3, 6)
+    init_padding_length = int(rng.integers(0, fs, endpoint=True))
+    max_length = max_audio_duration * fs
+    syl_idx = []
+    gap_lengths = []
+    length = init_padding_length
+    while length < max_length:
+        idx = int(rng.integers(len(syllables)))
+        gap_length = int(rng.integers(fs // 2, int(max_interval_length * fs), endpoint=True))
+        syl_idx.append(idx)
+        gap_lengths.append(gap_length)
+        length += len(syllables[idx]) + gap_length
+    return init_padding_length, syl_idx, gap_lengths, length
+
+def synthesize_syl_audio(syllables, fs, max_audio_duration, rng, awgn_only=False):
+    """Random syllables separated by AWGN gaps scaled to [-1, 1], built in a single buffer.
+
+    The lengths are planned first, the output is allocated once at its final size and all
+    the noise is drawn in one call, so the cost is linear in the track length.
+
+    Parameters:
+    --------
+    syllables: sequence of numpy.ndarray
+        Preprocessed syllables, e.g. a SyllableBank
+    rng: numpy.random.Generator
+        Source of randomness, the same seed gives the same track bit for bit
+    awgn_only: bool
+        Only AWGN of max_audio_duration, no syllables (first block)
+
+    Returns:
+    --------
+    audio: numpy.ndarray, float64
+    onsets: numpy.ndarray, int64
+        Index of the first sample of every syllable in audio
+    """
+    if awgn_only:
+        return rng.standard_normal(max_audio_duration * fs), np.zeros(0, dtype=np.int64)
+
+    init_padding_length, syl_idx, gap_lengths, length = _plan_track(syllables, fs, max_audio_duration, rng)
+    gap_lengths = np.asarray(gap_lengths, dtype=np.int64)
+    noise = rng.standard_normal(init_padding_length + int(gap_lengths.sum()))
+
+    # every gap is min-max scaled on its own, reduceat gives the min and max of all the gaps at once
+    gaps = noise[init_padding_length:]
+    if len(gap_lengths):
+        gap_starts = np.concatenate(([0], np.cumsum(gap_lengths)[:-1]))
+        gap_min = np.repeat(np.minimum.reduceat(gaps, gap_starts), gap_lengths)
+        gap_ptp = np.repeat(np.maximum.reduceat(gaps, gap_starts), gap_lengths) - gap_min
+        gaps = 2 * (gaps - gap_min) / gap_ptp - 1
+
+    audio = np.empty(length, dtype=np.float64)
+    audio[:init_padding_length] = noise[:init_padding_length]
+    onsets = np.empty(len(syl_idx), dtype=np.int64)
+    pos = init_padding_length
+    gap_pos = 0
+    for i, (idx, gap_length) in enumerate(zip(syl_idx, gap_lengths)):
+        syllable = syllables[idx]
+        onsets[i] = pos
+        audio[pos:pos + len(syllable)] = syllable
+        pos += len(syllable)
+        audio[pos:pos + gap_length] = gaps[gap_pos:gap_pos + gap_length]
+        pos += gap_length
+        gap_pos += gap_length
+    return audio, onsets
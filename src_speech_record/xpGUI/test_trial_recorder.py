@@ -0,0 +1,158 @@
+"""The trial recorder, driven as by the Tk main loop, with PortAudio replaced by slow fake streams.
+
+Run from xpGUI: python -m pytest test_trial_recorder.py
+"""
+import threading
+import time
+import wave
+
+import numpy as np
+import pytest
+
+from disk_worker import DiskWorker
+from trial_recorder import TrialRecorder
+
+
+FS = 16000
+CHANNELS = 2
+CHUNK = 1024
+# longer than the whole budget of a Tk handler, as opening a stream on a busy audio device can be
+BLOCKING_CALL = 0.2
+HANDLER_BUDGET = 0.05
+
+
+class FakeInputStream():
+    """Feeds silent buffers to the callback from a thread, in real time; start, stop and close
+    block like PortAudio can."""
+    def __init__(self, callback):
+        self.callback = callback
+        self.running = threading.Event()
+        self.thread = None
+
+    def start_stream(self):
+        time.sleep(BLOCKING_CALL)
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        data = bytes(CHUNK * CHANNELS * 2)
+        while self.running.is_set():
+            now = time.monotonic()
+            self.callback(data, CHUNK, {'input_buffer_adc_time': now, 'current_time': now}, 0)
+            time.sleep(CHUNK / FS)
+
+    def get_input_latency(self):
+        return 0.01
+
+    def stop_stream(self):
+        time.sleep(BLOCKING_CALL)
+        self.running.clear()
+        self.thread.join()
+
+    def close(self):
+        time.sleep(BLOCKING_CALL)
+
+
+class FakePlayer():
+    """StimulusPlayer whose playback lasts `duration` seconds of the monotonic clock."""
+    def __init__(self, duration=0.1):
+        self.duration = duration
+        self.start_time = None
+        self.end_time = None
+
+    def play(self, audio):
+        time.sleep(BLOCKING_CALL)
+        self.start_time = time.monotonic()
+        self.end_time = self.start_time + self.duration
+
+    def is_done(self):
+        return self.end_time is not None and time.monotonic() >= self.end_time
+
+    def close(self):
+        time.sleep(BLOCKING_CALL)
+
+
+def open_stream(callback):
+    time.sleep(BLOCKING_CALL)
+    return FakeInputStream(callback)
+
+
+def run_trial(recorder, worker, path, stimulus_length=FS, timeout=10):
+    """Steps of a trial as gui_v4 schedules them from the main loop; returns the events and
+    the duration of every handler call."""
+    events = []
+    durations = []
+
+    def timed(fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        result = fn(*args, **kwargs)
+        durations.append(time.perf_counter() - t0)
+        return result
+
+    timed(recorder.start, np.zeros(stimulus_length), on_started=lambda result, error: events.append(('started', error)))
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        timed(worker.poll)
+        if events and events[-1][0] == 'stopped':
+            break
+        if events and events[-1] == ('started', None) and timed(recorder.is_done):
+            timed(recorder.stop, path, on_stopped=lambda result, error: events.append(('stopped', result, error)))
+            events.append(('stopping',))
+        time.sleep(0.01)
+    return events, durations
+
+
+@pytest.fixture
+def worker():
+    worker = DiskWorker()
+    yield worker
+    worker.stop()
+
+
+def test_trial_handlers_do_not_block(tmp_path, worker):
+    recorder = TrialRecorder(open_stream, FakePlayer(), FS, CHANNELS, 2, worker)
+
+    # stimulus lengths, and the capacity of the ring: stimulus plus the 2 s margin, never shrunk
+    trials = [(FS, 3 * FS), (2 * FS, 4 * FS), (FS, 4 * FS)]
+    for trial, (stimulus_length, capacity) in enumerate(trials):
+        path = str(tmp_path / f'{trial}.wav')
+        events, durations = run_trial(recorder, worker, path, stimulus_length)
+
+        assert [event[0] for event in events] == ['started', 'stopping', 'stopped']
+        _, result, error = events[-1]
+        assert error is None
+        assert recorder.ring.capacity == capacity
+        assert 0 <= result['stimulus_start_sample'] < result['stimulus_end_sample']
+        assert recorder.state == 'idle'
+        # every PortAudio call blocked for BLOCKING_CALL, none of it on the main loop
+        assert max(durations) < HANDLER_BUDGET, f'a handler blocked for {max(durations) * 1000:.1f} ms'
+
+        with wave.open(path, 'rb') as wf:
+            assert wf.getnchannels() == CHANNELS
+            assert wf.getnframes() > 0
+
+
+def test_failed_start_is_reported(tmp_path, worker):
+    def failing_open(callback):
+        time.sleep(BLOCKING_CALL)
+        raise OSError('Invalid sample rate')
+
+    recorder = TrialRecorder(failing_open, FakePlayer(), FS, CHANNELS, 2, worker)
+    events, durations = run_trial(recorder, worker, str(tmp_path / 'trial.wav'), timeout=2)
+
+    assert len(events) == 1 and isinstance(events[0][1], OSError)
+    assert recorder.state == 'idle'
+    assert max(durations) < HANDLER_BUDGET
+
+
+def test_overrun_take_is_not_saved(tmp_path, worker):
+    # no margin: the input stream runs before and after the playback of the 10 ms stimulus
+    recorder = TrialRecorder(open_stream, FakePlayer(), FS, CHANNELS, 2, worker, margin=0)
+    path = tmp_path / 'trial.wav'
+    events, _ = run_trial(recorder, worker, str(path), stimulus_length=FS // 100)
+
+    _, result, error = events[-1]
+    assert isinstance(error, RuntimeError) and result is None
+    assert not path.exists()
+    assert recorder.state == 'idle'
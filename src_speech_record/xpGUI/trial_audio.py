@@ -0,0 +1,39 @@
+"""Generation of the trial audio on a worker thread."""
+import queue
+import threading
+
+from synthesis import synthesize_syl_audio
+
+
+class TrialAudioGenerator():
+    """Builds the syllable audio of the upcoming trials on a worker thread.
+
+    request() queues a trial, the audio comes out of `results` in request order as
+    (audio, onsets) tuples, to be polled from the Tk main loop. A single worker consumes
+    the requests in order, so the audio of a session stays reproducible from the seed of rng.
+    """
+    def __init__(self, syllables, fs, max_audio_duration, rng):
+        self.syllables = syllables
+        self.fs = fs
+        self.max_audio_duration = max_audio_duration
+        self.rng = rng
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def request(self, awgn_only=False):
+        """Queue the audio of a trial, awgn_only for the trials of the first block."""
+        self.requests.put(awgn_only)
+
+    def _run(self):
+        while True:
+            awgn_only = self.requests.get()
+            if awgn_only is None:
+                return
+            self.results.put(synthesize_syl_audio(
+                self.syllables, self.fs, self.max_audio_duration, self.rng, awgn_only=awgn_only))
+
+    def stop(self):
+        self.requests.put(None)
+        self.thread.join()
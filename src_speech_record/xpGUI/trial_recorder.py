@@ -0,0 +1,130 @@
+"""Capture and stimulus playback of a trial, without blocking the Tk main loop."""
+import os
+import sys
+import wave
+
+# the capture ring is shared with the recording apps, in audio_common at the root of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from audio_common.ring_buffer import CaptureRing
+
+# pyaudio.paContinue, the streams themselves are opened by the caller
+PA_CONTINUE = 0
+
+
+class TrialRecorder():
+    """Records the microphone while the stimulus is played, every PortAudio call off the Tk thread.
+
+    Opening, stopping and closing PortAudio streams can block for tens of milliseconds, so
+    start() and stop() only queue the work on `worker` (a DiskWorker) and return. The worker
+    also copies the recording out of the ring and writes the WAV file. Their on_done
+    callbacks run from the worker's poll(), i.e. from the Tk main loop.
+
+    The recording stops once the stimulus is played, so the capture ring is sized per trial
+    from the length of the stimulus plus `margin` seconds (input stream started before the
+    playback, output latency, polling of the end of the playback); it only grows. A take
+    that still overruns the ring is not saved.
+
+    state: 'idle' -> 'starting' -> 'recording' -> 'stopping' -> 'idle', only changed by the
+    Tk side (start(), stop() and the callbacks run by poll()).
+    """
+    def __init__(self, open_stream, player, fs, channels, sampwidth, worker, margin=2.0):
+        """
+        open_stream: callable
+            open_stream(stream_callback) opens the input stream (not started) and returns it
+        player: StimulusPlayer
+        margin: float
+            Capture time on top of the stimulus length, in seconds
+        """
+        self.open_stream = open_stream
+        self.player = player
+        self.fs = fs
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.worker = worker
+        self.margin = margin
+        self.ring = None
+        self.state = 'idle'
+        self.stream = None
+        self.capture_start_time = None
+
+    def start(self, stimulus, on_started):
+        """Open the input stream and start the playback on the worker, then on_started(None, error)."""
+        assert self.state == 'idle', self.state
+        self.state = 'starting'
+
+        def done(result, error):
+            self.state = 'idle' if error is not None else 'recording'
+            on_started(result, error)
+        self.worker.submit(self._start, stimulus, on_done=done)
+
+    def _start(self, stimulus):
+        # the previous trial was copied out by _stop, which ran before on this thread
+        capacity = len(stimulus) + round(self.margin * self.fs)
+        if self.ring is None or self.ring.capacity < capacity:
+            self.ring = CaptureRing(capacity_frames=capacity, channels=self.channels)
+        self.ring.reset()
+        self.capture_start_time = None
+        try:
+            self.stream = self.open_stream(self._callback)
+            self.stream.start_stream()
+            self.player.play(stimulus)
+        except Exception:
+            self._close_streams()
+            raise
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        """Copy the captured buffer into the ring, and note when its first sample was captured."""
+        if self.capture_start_time is None:
+            self.capture_start_time = time_info['input_buffer_adc_time'] or \
+                time_info['current_time'] - self.stream.get_input_latency()
+        self.ring.write(in_data)
+        return (None, PA_CONTINUE)
+
+    def is_done(self):
+        """True once the stimulus has been played, polled from the Tk main loop."""
+        return self.state == 'recording' and self.player.is_done()
+
+    def stop(self, path, on_stopped):
+        """Close the streams and write the recording to path on the worker, then on_stopped(result, error).
+
+        result: dict with the samples of the recording at which the stimulus starts and ends
+        (None when unknown); error is a RuntimeError when frames were dropped.
+        """
+        assert self.state == 'recording', self.state
+        self.state = 'stopping'
+
+        def done(result, error):
+            self.state = 'idle'
+            on_stopped(result, error)
+        self.worker.submit(self._stop, path, on_done=done)
+
+    def _stop(self, path):
+        self._close_streams()
+        if self.ring.overrun_frames > 0:
+            raise RuntimeError(f'Recording longer than the capture buffer, {self.ring.overrun_frames} frames '
+                               f'dropped, {path} not saved')
+        result = {
+            'stimulus_start_sample': self._to_capture_sample(self.player.start_time),
+            'stimulus_end_sample': self._to_capture_sample(self.player.end_time),
+        }
+        wf = wave.open(path, 'wb')
+        wf.setnchannels(self.channels)
+        wf.setsampwidth(self.sampwidth)
+        wf.setframerate(self.fs)
+        for view in self.ring.views():
+            wf.writeframes(view.tobytes())
+        wf.close()
+        return result
+
+    def _close_streams(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        self.player.close()
+
+    def _to_capture_sample(self, stream_time):
+        """Index in the recording of the sample captured at a PortAudio stream time."""
+        if stream_time is None or self.capture_start_time is None:
+            return None
+        return round((stream_time - self.capture_start_time) * self.fs)
@@ -1,3 +1,4 @@
+import json
 import librosa
 import numpy as np
 import os
@@ -16,20 +17,26 @@ def _vad_merge(w, top_db=20):
     intervals = librosa.effects.split(w, top_db=top_db)
     return np.concatenate([w[s:e] for s, e in intervals], axis=None)
 
-def _min_max_scaling(x, a=-1, b=1):
-    """Scale data in [a, b]"""
-    return (b - a) * (x - np.min(x)) / np.ptp(x) + a
+_TOKENIZER = RegexpTokenizer(r'\w+')
+_DIGITS = re.compile(r'\d+')
 
 def _lower_and_tokenize(text):
     """Tokenize and lowercase of a text prompt."""
-    tokenizer = RegexpTokenizer(r'\w+')
-    text = re.sub(r'\d+', ' ', text).lower()  # Remove digits and lowercase text
-    return text, tokenizer.tokenize(text)
+    text = _DIGITS.sub(' ', text).lower()  # Remove digits and lowercase text
+    return text, _TOKENIZER.tokenize(text)
+
+def _list_text_files(root):
+    """Paths of all the files below root, listed in a single walk."""
+    return {os.path.join(dirpath, fname).replace(os.sep, '/')
+            for dirpath, _, fnames in os.walk(root) for fname in fnames}
 
 def _find_records(language, min_words=10, max_words=15):
     """Find unique sentences for a certain language.
 
     Sentences have to be longer than min_words and shorter than max_words.
+    The result is cached next to the prompt file, keyed by language, min_words, max_words
+    and the modification time of the prompt file. An unreadable or unwritable cache is
+    ignored, the prompts are then parsed on every call.
 
     Parameters:
     --------
@@ -38,6 +45,35 @@ def _find_records(language, min_words=10, max_words=15):
     """
     assert language in ['EN', 'FR'], 'Language not available. Try "EN" for English, "FR" for French.'
 
+    prompt_file = f'siwis_database/prompts/ALL_{language}_prompts.txt'
+    cache_file = f'siwis_database/prompts/.ALL_{language}_prompts_{min_words}_{max_words}.json'
+    mtime_ns = os.stat(prompt_file).st_mtime_ns
+    try:
+        with open(cache_file, 'rt', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache['mtime_ns'] == mtime_ns:
+            print(f'Found {len(cache["prompts"])} records with {min_words}-{max_words} words (cached)')
+            return cache['prompts']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass  # no cache yet, or a corrupted one
+
+    prompts = _parse_records(prompt_file, language, min_words, max_words)
+
+    tmp_file = cache_file + '.tmp'
+    try:
+        with open(tmp_file, 'wt', encoding='utf-8') as f:
+            json.dump({'mtime_ns': mtime_ns, 'prompts': prompts}, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f'Prompt cache not written ({e})')
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+    return prompts
+
+def _parse_records(prompt_file, language, min_words, max_words):
+    """Parse and filter the prompt file, see _find_records."""
     # List of unwanted text scripts (grammatical mistakes, or prompted laughs from the subjects)
     blacklist = {
         'EN': (
@@ -193,13 +229,15 @@ def _find_records(language, min_words=10, max_words=15):
         )
     }
 
-    language_blacklist = blacklist[language]
+    language_blacklist = set(blacklist[language])
 
-    f = open(f'siwis_database/prompts/ALL_{language}_prompts.txt', 'rt', encoding='utf-8').read()
-    all_prompts = f.split('\n')
+    with open(prompt_file, 'rt', encoding='utf-8') as f:
+        all_prompts = f.read().split('\n')
+
+    existing = _list_text_files(f'siwis_database/txt/{language}')
 
     prompts = []
-    texts = []
+    texts = set()
 
     for prompt in all_prompts:
         if prompt:
@@ -207,14 +245,14 @@ def _find_records(language, min_words=10, max_words=15):
 
             text, word_list = _lower_and_tokenize(raw_text)
 
-            if (min_words < len(word_list) <= max_words) & (text not in texts) & (fname not in language_blacklist):
+            if (min_words < len(word_list) <= max_words) and (text not in texts) and (fname not in language_blacklist):
                 lang, id1, id2, id3 = fname.split('_')
                 folder_name = '_'.join([lang, id1, id2])
                 prompts.append(f'siwis_database/txt/{lang}/{folder_name}/{fname}')
-                texts.append(text)
+                texts.add(text)
 
                 # Sanity check
-                assert(os.path.exists(prompts[-1]))
+                assert prompts[-1] in existing, prompts[-1]
 
     print(f'Found {len(prompts)} records with {min_words}-{max_words} words')
     # Sort the file names by default
@@ -229,13 +267,20 @@ def _init_root():
     return root
 
 def _init_results_folder():
-    """Initialize a new folder for the current user."""
-    user_idx = 0
+    """Initialize a new folder for the current user.
 
-    while os.path.isdir(f'results/{user_idx}'):
-        user_idx += 1
+    The index follows the highest existing one; os.mkdir fails if the folder exists, so two
+    sessions started at the same time never get the same index.
+    """
+    os.makedirs('results', exist_ok=True)
+    user_idx = max([int(name) for name in os.listdir('results') if name.isdigit()], default=-1) + 1
 
-    os.makedirs(f'results/{user_idx}')
+    while True:
+        try:
+            os.mkdir(f'results/{user_idx}')
+            break
+        except FileExistsError:
+            user_idx += 1
 
     print(f'User index: {user_idx}')
 